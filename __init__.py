@@ -58,6 +58,7 @@ class Level5_Menu_Import(bpy.types.Menu):
         layout.operator(ImportXMTN.bl_idname, text="Animation (xmtn)", icon="POSE_HLT")
         layout.operator(ImportXMPR.bl_idname, text="Mesh (xprm)", icon="MESH_DATA")
         layout.operator(ImportXC.bl_idname, text="Archive (xpck)", icon="FILE_3D")  
+        layout.operator(DecodeXCTextures.bl_idname, text="Decode textures (xpck)", icon="IMAGE_DATA")
         layout.operator(ImportXCMA.bl_idname, text="Camera (xcma)", icon="OUTLINER_OB_CAMERA")
     
 def draw_menu_export(self, context):
@@ -85,10 +86,12 @@ def register():
     
     bpy.utils.register_class(ImportXMTN)
     bpy.utils.register_class(ImportXC)
+    bpy.utils.register_class(DecodeXCTextures)
     bpy.utils.register_class(ImportXMPR)
     bpy.utils.register_class(ImportXCMA)
     bpy.utils.register_class(Level5_Menu_Import)
     bpy.types.TOPBAR_MT_file_import.append(draw_menu_import)
+    bpy.app.handlers.load_post.append(clear_pending_textures)
 
 
 def unregister():
@@ -110,10 +113,13 @@ def unregister():
     
     bpy.utils.unregister_class(ImportXMTN)
     bpy.utils.unregister_class(ImportXC)
+    bpy.utils.unregister_class(DecodeXCTextures)
     bpy.utils.unregister_class(ImportXMPR)
     bpy.utils.unregister_class(ImportXCMA)
     bpy.utils.unregister_class(Level5_Menu_Import)      
     bpy.types.TOPBAR_MT_file_import.remove(draw_menu_import)
+    bpy.app.handlers.load_post.remove(clear_pending_textures)
+    clear_pending_textures(None)
 
 if __name__ == "__main__":
     register()
\ No newline at end of file
@@ -0,0 +1,26 @@
+"""
+Check that the fast codecs give the same output as their reference
+implementations. Run it from the addon folder, Blender isn't needed:
+
+    python -m check_codecs
+
+Raises AssertionError on the first difference.
+"""
+import os
+import sys
+import types
+import importlib
+
+PACKAGE = "studio_eleven"
+PACKAGE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# The addon __init__ imports bpy, so the folder is registered as a bare
+# package like the export workers do, compression only needs utils
+if __name__ == "__main__":
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [PACKAGE_PATH]
+        sys.modules[PACKAGE] = package
+
+    benchmark = importlib.import_module(PACKAGE + ".compression.benchmark")
+    benchmark.check_parity()
@@ -4,4 +4,6 @@ from .lzss import *
 from .huffman import *
 from .compressor import *
 from .zlib_level5 import *
-from .etc1 import *
\ No newline at end of file
+from .etc1 import *
+from .planner import *
+from .cache import *
\ No newline at end of file
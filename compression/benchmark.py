@@ -0,0 +1,368 @@
+import math
+import time
+import random
+import struct
+
+from . import lz10, lzss, huffman, rle, etc1
+
+##########################################
+# Synthetic payloads
+##########################################
+
+def vertex_buffer(vertex_count, seed=0):
+    # XPVB layout: position, normal, uv0, uv1, weights, bone indices, colour (88 bytes)
+    rng = random.Random(seed)
+    side = max(1, int(math.sqrt(vertex_count)))
+
+    out = bytearray()
+    for i in range(vertex_count):
+        x, y = i % side, i // side
+        z = math.sin(x * 0.1) * math.cos(y * 0.1)
+        u, v = x / side, y / side
+        bone = rng.randrange(4)
+        out += struct.pack("<22f",
+            x * 0.05, y * 0.05, z,
+            0.0, 0.0, 1.0,
+            u, 1 - v, u, 1 - v,
+            1.0, 0.0, 0.0, 0.0,
+            float(bone), 0.0, 0.0, 0.0,
+            1.0, 1.0, 1.0, 1.0)
+
+    return bytes(out)
+
+def index_buffer(index_count):
+    # Triangle strips over a grid, like stripify output
+    out = bytearray()
+    side = 64
+    row = 0
+
+    while len(out) < index_count * 2:
+        for x in range(side):
+            out += struct.pack("<HH", row * side + x, (row + 1) * side + x)
+        row = (row + 1) % (0xFFFF // side - 1)
+
+    return bytes(out[:index_count * 2])
+
+def texture_buffer(width, height, seed=0):
+    # RGBA8 gradient with a little noise, stored as 8x8 tiles
+    rng = random.Random(seed)
+
+    out = bytearray()
+    for h in range(0, height, 8):
+        for w in range(0, width, 8):
+            for bh in range(8):
+                for bw in range(8):
+                    x, y = w + bw, h + bh
+                    noise = rng.randrange(4)
+                    out += bytes([(x * 255 // width) & 0xFC | noise, (y * 255 // height) & 0xFC, 128, 255])
+
+    return bytes(out)
+
+def etc1_blocks(width, height, has_alpha_channel, seed=0):
+    # Random blocks cover every flag, table and out of range differential colour
+    rng = random.Random(seed)
+    block_size = 16 if has_alpha_channel else 8
+
+    size = width // 4 * height // 4 * block_size
+    return rng.getrandbits(size * 8).to_bytes(size, 'little')
+
+def synthetic_buffers(size=0x40000):
+    side = int(math.sqrt(size // 4)) & ~0x7
+
+    return {
+        "vertex": vertex_buffer(size // 88),
+        "index": index_buffer(size // 2),
+        "texture": texture_buffer(side, side),
+    }
+
+def parity_fixtures(size=0x10000):
+    # Synthetic payloads and the edge cases of each codec
+    rng = random.Random(0)
+
+    fixtures = synthetic_buffers(size)
+    fixtures.update({
+        "empty": b'',
+        "one": b'\x2a',
+        "short": b'abcab',
+        "zeros": bytes(0x1234),
+        "random": bytes(rng.randrange(256) for i in range(0x2000)),
+        "runs": b''.join(bytes([rng.randrange(4)]) * rng.randrange(1, 200) for i in range(200)),
+    })
+
+    return fixtures
+
+##########################################
+# Benchmark
+##########################################
+
+def measure(function, *args, repeat=1):
+    best = None
+    result = None
+
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return result, best
+
+def benchmark_lz10(size=0x40000, repeat=1):
+    compressors = {
+        "hash_chain": lz10.compress,
+        "binary_search": lz10.compress_binary_search,
+    }
+
+    results = []
+    for name, data in synthetic_buffers(size).items():
+        for compressor_name, function in compressors.items():
+            compressed, elapsed = measure(function, data, repeat=repeat)
+
+            if lzss.lzss_decompress(compressed)[:len(data)] != data:
+                raise ValueError(f"{compressor_name} round trip failed on {name}")
+
+            results.append({
+                "buffer": name,
+                "compressor": compressor_name,
+                "size": len(data),
+                "compressed_size": len(compressed),
+                "ratio": len(compressed) / len(data),
+                "seconds": elapsed,
+                "mb_per_second": len(data) / elapsed / 1000000,
+            })
+
+    for result in results:
+        print(f"{result['buffer']:<8} {result['compressor']:<14} {result['ratio']:6.3f} {result['mb_per_second']:8.3f} MB/s")
+
+    return results
+
+def benchmark_lz10_levels(size=0x40000, repeat=1):
+    # Size gained and time spent by each level compared to LEVEL_NORMAL
+    results = []
+    for name, data in synthetic_buffers(size).items():
+        reference = None
+
+        for level in (lz10.LEVEL_NORMAL, lz10.LEVEL_FAST, lz10.LEVEL_MAX):
+            compressed, elapsed = measure(lz10.compress, data, level, repeat=repeat)
+
+            if lzss.lzss_decompress(compressed)[:len(data)] != data:
+                raise ValueError(f"LZ10 {level} round trip failed on {name}")
+
+            if reference is None:
+                reference = (len(compressed), elapsed)
+
+            results.append({
+                "buffer": name,
+                "level": level,
+                "size": len(data),
+                "compressed_size": len(compressed),
+                "ratio": len(compressed) / len(data),
+                "size_gain": 1 - len(compressed) / reference[0],
+                "time_cost": elapsed / reference[1],
+                "seconds": elapsed,
+                "mb_per_second": len(data) / elapsed / 1000000,
+            })
+
+    for result in results:
+        print(f"{result['buffer']:<8} {result['level']:<7} {result['ratio']:6.3f} {result['size_gain'] * 100:+6.2f}% {result['time_cost']:6.2f}x {result['mb_per_second']:8.3f} MB/s")
+
+    return results
+
+def benchmark_lzss_decompress(size=0x40000, repeat=3):
+    # Decompress round-tripped buffers with the in-place and the bytewise decoders
+    results = []
+    for name, data in synthetic_buffers(size).items():
+        for level in (lz10.LEVEL_FAST, lz10.LEVEL_MAX):
+            compressed = lz10.compress(data, level)
+
+            decompressed, elapsed = measure(lzss.lzss_decompress, compressed, repeat=repeat)
+            reference, reference_elapsed = measure(lzss.lzss_decompress_bytewise, compressed, repeat=repeat)
+
+            if decompressed != data or reference[:len(data)] != data:
+                raise ValueError(f"LZSS round trip failed on {name} ({level})")
+
+            results.append({
+                "buffer": name,
+                "level": level,
+                "size": len(data),
+                "seconds": elapsed,
+                "mb_per_second": len(data) / elapsed / 1000000,
+                "speedup": reference_elapsed / elapsed,
+            })
+
+    for result in results:
+        print(f"{result['buffer']:<8} {result['level']:<7} {result['mb_per_second']:8.3f} MB/s {result['speedup']:6.2f}x")
+
+    return results
+
+def benchmark_huffman_decompress(size=0x40000, repeat=3):
+    # Decompress round-tripped buffers with the table and the bitwise decoders
+    results = []
+    for name, data in synthetic_buffers(size).items():
+        for bit_depth in (4, 8):
+            compressed = huffman.compress(data, bit_depth)
+
+            decompressed, elapsed = measure(huffman.decompress, compressed, bit_depth, repeat=repeat)
+            reference, reference_elapsed = measure(huffman.decompress_bitwise, compressed, bit_depth, repeat=repeat)
+
+            if decompressed != data or reference != data:
+                raise ValueError(f"Huffman{bit_depth} round trip failed on {name}")
+
+            results.append({
+                "buffer": name,
+                "bit_depth": bit_depth,
+                "size": len(data),
+                "ratio": len(compressed) / len(data),
+                "seconds": elapsed,
+                "mb_per_second": len(data) / elapsed / 1000000,
+                "speedup": reference_elapsed / elapsed,
+            })
+
+    for result in results:
+        print(f"{result['buffer']:<8} Huffman{result['bit_depth']:<2} {result['ratio']:6.3f} {result['mb_per_second']:8.3f} MB/s {result['speedup']:6.2f}x")
+
+    return results
+
+def decompress_rle_preallocated(input_bytes):
+    # rle.decompress writing through a memoryview of a preallocated output instead of extending one
+    data = bytes(input_bytes)
+    size = rle.read_header(data)
+    source = memoryview(data)
+
+    # Room for a whole block past the end, the padding is cut afterwards
+    output = bytearray(size + 0x82)
+    view = memoryview(output)
+    written = 0
+    pos = 4
+    end = len(data)
+
+    while pos < end and written < size:
+        flag = data[pos]
+
+        if flag & 0x80:
+            length = flag - 0x7D
+            view[written:written + length] = data[pos + 1:pos + 2] * length
+            pos += 2
+        else:
+            length = flag + 1
+            pos += 1
+            view[written:written + length] = source[pos:pos + length]
+            pos += length
+
+        written += length
+
+    view.release()
+    del output[size:]
+
+    return bytes(output)
+
+def benchmark_rle_decompress(size=0x40000, repeat=3):
+    # Decompress round-tripped buffers with the extending, preallocated, streaming and bytewise decoders
+    results = []
+    for name, data in synthetic_buffers(size).items():
+        compressed = rle.compress(data)
+
+        decompressed, elapsed = measure(rle.decompress, compressed, repeat=repeat)
+        preallocated, preallocated_elapsed = measure(decompress_rle_preallocated, compressed, repeat=repeat)
+        # The stream is consumed like a parser would, without joining the views
+        stream_elapsed = measure(lambda: sum(len(view) for view in rle.decompress_stream(compressed)), repeat=repeat)[1]
+        streamed = b''.join(rle.decompress_stream(compressed))
+        reference, reference_elapsed = measure(rle.decompress_bytewise, compressed, repeat=repeat)
+
+        if decompressed != data or preallocated != data or streamed != data or reference[:len(data)] != data:
+            raise ValueError(f"RLE round trip failed on {name}")
+
+        results.append({
+            "buffer": name,
+            "size": len(data),
+            "ratio": len(compressed) / len(data),
+            "seconds": elapsed,
+            "mb_per_second": len(data) / elapsed / 1000000,
+            "speedup": reference_elapsed / elapsed,
+            "preallocated_speedup": reference_elapsed / preallocated_elapsed,
+            "stream_speedup": reference_elapsed / stream_elapsed,
+        })
+
+    for result in results:
+        print(f"{result['buffer']:<8} {result['ratio']:6.3f} {result['mb_per_second']:8.3f} MB/s {result['speedup']:6.2f}x (preallocated {result['preallocated_speedup']:6.2f}x, stream {result['stream_speedup']:6.2f}x)")
+
+    return results
+
+def codec_outputs(fixtures):
+    # Output of each fast codec and of its reference implementation, by (fixture, codec, parameter)
+    outputs = {}
+
+    for name, data in fixtures.items():
+        for level in (lz10.LEVEL_FAST, lz10.LEVEL_NORMAL, lz10.LEVEL_MAX):
+            compressed = lz10.compress(data, level)
+            outputs[(name, "lz10", level)] = (lzss.lzss_decompress(compressed), data)
+
+            lz10.USE_NUMPY_INDEX = False
+            try:
+                outputs[(name, "lz10 index", level)] = (compressed, lz10.compress(data, level))
+            finally:
+                lz10.USE_NUMPY_INDEX = True
+
+            # The bytewise decoders don't cut the padding after the last block
+            outputs[(name, "lzss", level)] = (lzss.lzss_decompress(compressed), lzss.lzss_decompress_bytewise(compressed)[:len(data)])
+
+        for bit_depth in (4, 8):
+            try:
+                compressed = huffman.compress(data, bit_depth)
+            except ValueError:
+                continue
+            outputs[(name, "huffman", bit_depth)] = (huffman.decompress(compressed, bit_depth), huffman.decompress_bitwise(compressed, bit_depth))
+
+        compressed = rle.compress(data)
+        outputs[(name, "rle", 0)] = (rle.decompress(compressed), rle.decompress_bytewise(compressed)[:len(data)])
+        outputs[(name, "rle stream", 0)] = (b''.join(rle.decompress_stream(compressed)), data)
+
+    return outputs
+
+def check_parity(size=0x10000):
+    """
+    Compare the LZ10 numpy index with the per-position one, and the LZSS,
+    Huffman and RLE decoders with their original bytewise decoders, over
+    the same fixtures. Raises AssertionError on the first difference.
+    """
+    outputs, elapsed = measure(codec_outputs, parity_fixtures(size))
+
+    for key, (output, reference) in outputs.items():
+        if output != reference:
+            raise AssertionError(f"{key[1]} differs from its reference on {key[0]} ({key[2]})")
+
+    print(f"{len(outputs)} checks passed in {elapsed:.3f}s")
+
+    return len(outputs)
+
+def benchmark_etc1_decompress(sizes=(256, 512, 1024), repeat=3, reference=True):
+    # Decode random textures with the numpy and the per-block decoders
+    results = []
+    for side in sizes:
+        for has_alpha_channel in (False, True):
+            data = etc1_blocks(side, side, has_alpha_channel)
+
+            decoded, elapsed = measure(etc1.decompress_blocks, data, side, side, has_alpha_channel, repeat=repeat)
+
+            speedup = None
+            if reference:
+                expected, reference_elapsed = measure(etc1.ETC1Decoder.decompress_etc1a4, data, side, side, has_alpha_channel)
+                if decoded != expected:
+                    raise ValueError(f"ETC1 decoders differ on {side}x{side} (alpha {has_alpha_channel})")
+                speedup = reference_elapsed / elapsed
+
+            results.append({
+                "size": side,
+                "format": "ETC1A4" if has_alpha_channel else "ETC1",
+                "seconds": elapsed,
+                "mpixels_per_second": side * side / elapsed / 1000000,
+                "speedup": speedup,
+            })
+
+    for result in results:
+        speedup = f"{result['speedup']:7.2f}x" if result['speedup'] else ""
+        print(f"{result['size']:>4}x{result['size']:<4} {result['format']:<6} {result['seconds']:7.3f}s {result['mpixels_per_second']:8.3f} MP/s {speedup}")
+
+    return results
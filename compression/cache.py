@@ -0,0 +1,197 @@
+import os
+import struct
+import hashlib
+import tempfile
+import numpy as np
+
+from io import BytesIO
+
+__all__ = ["CompressionCache", "TextureCache"]
+
+# Bump when an encoder changes its output, older entries are then never hit
+CACHE_VERSION = 1
+
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), "level5_compression_cache")
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# Bump when a texture decoder changes its output
+TEXTURE_CACHE_VERSION = 1
+
+TEXTURE_DIRECTORY = os.path.join(tempfile.gettempdir(), "level5_texture_cache")
+TEXTURE_MAX_SIZE = 1024 * 1024 * 1024
+
+class CompressionCache:
+    """
+    Compressed payloads stored on disk by the hash of the uncompressed data
+    and of the codec parameters. The least recently used entries are removed
+    once the cache is bigger than `max_size` bytes.
+    """
+
+    version = CACHE_VERSION
+    extension = ".bin"
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        # Running size of the directory, read once on the first put
+        self.total_size = None
+
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, data, parameters):
+        digest = hashlib.sha256(f"{self.version}:{parameters}:".encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.extension)
+
+    def read(self, key):
+        try:
+            with open(self.path(key), 'rb') as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def remove(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def touch(self, key):
+        # The modification time is the last use
+        try:
+            os.utime(self.path(key))
+        except OSError:
+            pass
+
+    def get(self, key, size):
+        output = self.read(key)
+
+        # The header must hold the uncompressed size, anything else is a broken entry
+        if output is None or len(output) < 4 or struct.unpack_from('<I', output)[0] >> 3 != size:
+            self.misses += 1
+            return None
+
+        self.touch(key)
+        self.hits += 1
+        return output
+
+    def put(self, key, output):
+        path = self.path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+
+        if self.total_size is None:
+            self.total_size = self.size()
+
+        # An entry with the same key is replaced
+        try:
+            replaced_size = os.stat(path).st_size
+        except OSError:
+            replaced_size = 0
+
+        # Written aside then moved, so export workers never read half an entry
+        try:
+            with open(temp_path, 'wb') as file:
+                file.write(output)
+            os.replace(temp_path, path)
+        except OSError:
+            # Eviction only sees finished entries
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+
+        self.total_size += len(output) - replaced_size
+
+        # Other processes can write to the directory too, so the total is
+        # only a trigger and evict reads the real size again
+        if self.total_size > self.max_size:
+            self.evict()
+
+    def entries(self):
+        entries = []
+
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.extension):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        return entries
+
+    def size(self):
+        return sum(size for mtime, size, path in self.entries())
+
+    def evict(self):
+        entries = self.entries()
+        size = sum(entry_size for mtime, entry_size, path in entries)
+
+        # Oldest first
+        for mtime, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+            size -= entry_size
+
+        self.total_size = size
+
+    def clear(self):
+        for mtime, size, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        self.total_size = None
+
+class TextureCache(CompressionCache):
+    """
+    Decoded textures stored on disk as RGBA8 .npy arrays by the hash of the
+    texture file, with the same eviction as CompressionCache.
+    """
+
+    version = TEXTURE_CACHE_VERSION
+    extension = ".npy"
+
+    def __init__(self, directory=TEXTURE_DIRECTORY, max_size=TEXTURE_MAX_SIZE):
+        super().__init__(directory, max_size)
+
+    def get(self, key, size):
+        data = self.read(key)
+
+        pixels = None
+        if data is not None:
+            try:
+                pixels = np.load(BytesIO(data), allow_pickle=False)
+            except (ValueError, EOFError, OSError):
+                pass
+
+        # Anything else than `size` bytes is a broken entry
+        if pixels is None or pixels.dtype != np.uint8 or pixels.size != size:
+            if data is not None:
+                self.remove(key)
+            self.misses += 1
+            return None
+
+        self.touch(key)
+        self.hits += 1
+        return pixels.ravel()
+
+    def put(self, key, pixels):
+        data = BytesIO()
+        np.save(data, np.ascontiguousarray(pixels, dtype=np.uint8), allow_pickle=False)
+        super().put(key, data.getvalue())
@@ -1,4 +1,6 @@
-from ..compression import *
+import struct
+
+from . import lz10, lzss, huffman, rle, zlib_level5
 
 def decompress(data):
     size_method_buffer = data[:4]
@@ -10,7 +12,7 @@ def decompress(data):
     if method == 0:
         return data[4:]
     elif method == 1:
-        return lzss_decompress(data)
+        return lzss.lzss_decompress(data)
     elif method == 2:
         return huffman.decompress(data, 4)
     elif method == 3:
@@ -21,4 +23,19 @@ def decompress(data):
         return zlib_level5.zlib_decompress(data)
     else:
         return None      
-    
\ No newline at end of file
+
+def compress(data, method=1):
+    if method == 0:
+        return struct.pack('<I', len(data) << 3) + bytes(data)
+    elif method == 1:
+        return lz10.compress(data)
+    elif method == 2:
+        return huffman.compress(data, 4)
+    elif method == 3:
+        return huffman.compress(data, 8)
+    elif method == 4:
+        return rle.compress(data)
+    elif method == 5:
+        return zlib_level5.zlib_compress(data)
+    else:
+        raise ValueError(f"Unknown compression method {method}")
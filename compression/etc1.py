@@ -1,4 +1,8 @@
+import math
+import time
 import struct
+import numpy as np
+
 
 from typing import List
 from ..utils.img_format import RGB
@@ -16,6 +20,31 @@ modifiers = [
 
 pixel_order = [0, 4, 1, 5, 8, 12, 9, 13, 2, 6, 3, 7, 10, 14, 11, 15]
 
+MODIFIERS = np.array(modifiers, dtype=np.int32)
+PIXEL_ORDER = np.array(pixel_order, dtype=np.int32)
+
+# Encoder quality: "fast" only tries the layout of the average colours,
+# "medium" tries both flips and both colour modes, "exhaustive" also
+# searches the base colours around the averages
+QUALITY_FAST = "fast"
+QUALITY_MEDIUM = "medium"
+QUALITY_EXHAUSTIVE = "exhaustive"
+
+# Pixels (bit indices) of the two sub-blocks, without and with the flip bit
+SUBBLOCKS = [
+    (np.array([0, 1, 2, 3, 4, 5, 6, 7]), np.array([8, 9, 10, 11, 12, 13, 14, 15])),
+    (np.array([0, 1, 4, 5, 8, 9, 12, 13]), np.array([2, 3, 6, 7, 10, 11, 14, 15])),
+]
+
+# Channel weights of RGB._error_rgb
+ERROR_WEIGHTS = np.array([2, 4, 3], dtype=np.int32)
+
+# Base colour offsets tried by the exhaustive search
+NEIGHBOURS = np.array([(r, g, b) for r in (-1, 0, 1) for g in (-1, 0, 1) for b in (-1, 0, 1)], dtype=np.int32)
+
+# Blocks encoded per batch, bounds the memory of the search
+CHUNK_BLOCKS = 2048
+
 # ETC1 class for compressing and decompressing ETC1 image data
 class ETC1:
     def __init__(self, has_alpha_channel, width, height):
@@ -23,13 +52,263 @@ class ETC1:
         self.Width = width
         self.Height = height
 
-    # Method for compressing data (Not Implemented)
-    def compress(self, data):
-        return None
+    # Method for compressing RGBA pixels, given in the order decompress returns them
+    def compress(self, data, quality=QUALITY_MEDIUM):
+        start = time.perf_counter()
+
+        pixels = np.asarray(data, dtype=np.int32).reshape(-1, 16, 4)
+        output = compress_blocks(pixels, self.has_alpha_channel, quality)
+
+        self.seconds = time.perf_counter() - start
+        self.psnr = psnr(pixels, decompress_blocks(output, 4, 4 * len(pixels), self.has_alpha_channel), self.has_alpha_channel)
+
+        return output
 
     # Method for decompressing ETC1a4 data
     def decompress(self, data):
-        return ETC1Decoder.decompress_etc1a4(data, self.Width, self.Height, self.has_alpha_channel)
+        return decompress_blocks(data, self.Width, self.Height, self.has_alpha_channel)
+
+def read_blocks(data, width, height, has_alpha_channel):
+    # One row of 64 bits words per block, alpha first
+    block_count = ((width + 3) // 4) * ((height + 3) // 4)
+    block_size = 16 if has_alpha_channel else 8
+
+    data = bytes(data[:block_count * block_size]).ljust(block_count * block_size, b'\x00')
+    return np.frombuffer(data, dtype='<u8').reshape(block_count, block_size // 8)
+
+def base_colors(colors):
+    # Flags and the two 8 bits base colours of each colour block
+    flags = (colors >> 32 & 0xFF).astype(np.int32)
+    rgb = np.stack([colors >> 56, colors >> 48 & 0xFF, colors >> 40 & 0xFF], axis=1).astype(np.int32)
+
+    diff = (flags & 2 != 0)[:, None]
+
+    # Base colours, 5 bits + signed 3 bits delta or two 4 bits colours
+    color0 = np.where(diff, rgb >> 3, rgb >> 4)
+    color1 = np.where(diff, color0 + ((rgb & 7) + 4) % 8 - 4, rgb & 15)
+
+    color0 = np.where(diff, color0 << 3 | color0 >> 2, color0 * 17)
+    color1 = np.where(diff, color1 << 3 | color1 >> 2, color1 * 17)
+
+    return flags, color0, color1
+
+def block_colors(data, width, height, has_alpha_channel):
+    """
+    One RGB or RGBA colour per block without decoding the pixels:
+    the average of the two base colours and of the 16 alphas.
+    """
+    blocks = read_blocks(data, width, height, has_alpha_channel)
+    flags, color0, color1 = base_colors(blocks[:, -1])
+
+    colors = np.clip(np.rint((color0 + color1) / 2), 0, 255).astype(np.uint8)
+
+    if has_alpha_channel:
+        shifts = np.arange(0, 64, 4, dtype=np.uint64)
+        alphas = (blocks[:, :1] >> shifts & 0xF).astype(np.int32).sum(axis=1) * 17
+        colors = np.concatenate([colors, np.rint(alphas / 16).astype(np.uint8)[:, None]], axis=1)
+
+    return colors
+
+def decompress_blocks(data, width, height, has_alpha_channel):
+    """
+    Decode every ETC1/ETC1A4 block at once.
+    Same output as ETC1Decoder.decompress_etc1a4: blocks one after the other,
+    the 16 pixels of each block in pixel_order, RGB or RGBA bytes.
+    """
+    blocks = read_blocks(data, width, height, has_alpha_channel)
+
+    # Colour block: modifier bits lsb/msb, flags, then B, G, R
+    colors = blocks[:, -1]
+    lsb = (colors & 0xFFFF).astype(np.int32)
+    msb = (colors >> 16 & 0xFFFF).astype(np.int32)
+    flags, color0, color1 = base_colors(colors)
+
+    table0 = flags >> 5 & 7
+    table1 = flags >> 2 & 7
+
+    # Sub-block of each pixel, split vertically or horizontally by the flip bit
+    flip_mask = np.where(flags & 1 != 0, 2, 8)
+    second = (PIXEL_ORDER[None, :] & flip_mask[:, None]) != 0
+
+    base = np.where(second[:, :, None], color1[:, None, :], color0[:, None, :])
+    table = np.where(second, table1[:, None], table0[:, None])
+    index = (msb[:, None] >> PIXEL_ORDER & 1) * 2 + (lsb[:, None] >> PIXEL_ORDER & 1)
+
+    pixels = np.clip(base + MODIFIERS[table, index][:, :, None], 0, 255).astype(np.uint8)
+
+    if has_alpha_channel:
+        # 4 bits alpha per pixel
+        shifts = (PIXEL_ORDER * 4).astype(np.uint64)
+        alphas = ((blocks[:, :1] >> shifts & 0xF) * 17).astype(np.uint8)
+        pixels = np.concatenate([pixels, alphas[:, :, None]], axis=2)
+
+    return pixels.tobytes()
+
+def expand(colors, diff):
+    # 4 or 5 bits colours to 8 bits
+    return np.where(diff, colors << 3 | colors >> 2, colors * 17)
+
+def quantize(colors, diff):
+    return np.where(diff, np.rint(colors * 31 / 255), np.rint(colors * 15 / 255)).astype(np.int32)
+
+def subblock_error(pixels, colors):
+    """
+    Best table and modifier of each pixel for the base `colors` of a sub-block.
+    pixels is (blocks, 8, 3), colors (blocks, 3) with 8 bits channels.
+    Returns the error, table and modifier indices (blocks, 8).
+    """
+    candidates = np.clip(colors[:, None, None, :] + MODIFIERS[None, :, :, None], 0, 255)
+    difference = pixels[:, None, :, None, :] - candidates[:, :, None, :, :]
+    errors = (difference * difference * ERROR_WEIGHTS).sum(axis=4)
+
+    indices = errors.argmin(axis=3)
+    table_errors = errors.min(axis=3).sum(axis=2)
+    tables = table_errors.argmin(axis=1)
+
+    blocks = np.arange(len(pixels))
+    return table_errors[blocks, tables], tables, indices[blocks, tables]
+
+def search_colors(pixels, colors, diff, low=None, high=None):
+    # Try the quantized colours around `colors` and keep the best one per block
+    limit = np.where(diff, 31, 15)
+
+    best = None
+    for offset in NEIGHBOURS:
+        candidate = np.clip(colors + offset, 0, limit)
+        if low is not None:
+            candidate = np.clip(candidate, low, high)
+
+        error, table, indices = subblock_error(pixels, expand(candidate, diff))
+
+        if best is None:
+            best = [error, candidate, table, indices]
+        else:
+            better = error < best[0]
+            best[0] = np.where(better, error, best[0])
+            best[1] = np.where(better[:, None], candidate, best[1])
+            best[2] = np.where(better, table, best[2])
+            best[3] = np.where(better[:, None], indices, best[3])
+
+    return best
+
+def encode_layout(pixels, flip, diff, search=False):
+    # Encode every block with the given flip bit and colour mode (diff is (blocks, 1))
+    pixels0 = pixels[:, SUBBLOCKS[flip][0], :3]
+    pixels1 = pixels[:, SUBBLOCKS[flip][1], :3]
+
+    color0 = quantize(pixels0.mean(axis=1), diff)
+    color1 = quantize(pixels1.mean(axis=1), diff)
+
+    if search:
+        error0, color0, table0, indices0 = search_colors(pixels0, color0, diff)
+        low = np.where(diff, color0 - 4, 0)
+        high = np.where(diff, color0 + 3, 15)
+        error1, color1, table1, indices1 = search_colors(pixels1, color1, diff, low, high)
+    else:
+        # The differential colour only reaches -4 to +3 from the first one
+        color1 = np.where(diff, np.clip(color1, color0 - 4, color0 + 3), color1)
+        error0, table0, indices0 = subblock_error(pixels0, expand(color0, diff))
+        error1, table1, indices1 = subblock_error(pixels1, expand(color1, diff))
+
+    # Colour word: modifier bits, flags, then B, G, R
+    flags = table0 << 5 | table1 << 2 | diff[:, 0] << 1 | flip
+    channels = np.where(diff, color0 << 3 | (color1 - color0) & 7, color0 << 4 | color1)
+
+    modifier_bits = np.zeros(len(pixels), dtype=np.int64)
+    for subblock, indices in zip(SUBBLOCKS[flip], (indices0, indices1)):
+        for pixel, bit in enumerate(subblock):
+            modifier_bits |= (indices[:, pixel] & 1).astype(np.int64) << int(bit)
+            modifier_bits |= (indices[:, pixel] >> 1).astype(np.int64) << int(bit + 16)
+
+    word = modifier_bits.astype(np.uint64)
+    word |= flags.astype(np.uint64) << np.uint64(32)
+    word |= channels[:, 2].astype(np.uint64) << np.uint64(40)
+    word |= channels[:, 1].astype(np.uint64) << np.uint64(48)
+    word |= channels[:, 0].astype(np.uint64) << np.uint64(56)
+
+    return error0 + error1, word
+
+def compress_chunk(pixels, has_alpha_channel, quality):
+    # pixels is (blocks, 16, 4) in bit index order
+    averages0 = quantize(pixels[:, SUBBLOCKS[0][0], :3].mean(axis=1), True)
+    averages1 = quantize(pixels[:, SUBBLOCKS[0][1], :3].mean(axis=1), True)
+    fits = np.all(np.abs(averages1 - averages0) <= 3, axis=1)[:, None]
+
+    if quality == QUALITY_FAST:
+        # Differential mode when the averages are close enough
+        layouts = [(0, fits)]
+    else:
+        true = np.ones((len(pixels), 1), dtype=bool)
+        layouts = [(flip, diff) for flip in (0, 1) for diff in (true, ~true)]
+
+    best_error = best_word = best_layout = None
+    for layout, (flip, diff) in enumerate(layouts):
+        error, word = encode_layout(pixels, flip, diff)
+
+        if best_error is None:
+            best_error, best_word, best_layout = error, word, np.zeros(len(pixels), dtype=np.int32)
+        else:
+            better = error < best_error
+            best_error = np.where(better, error, best_error)
+            best_word = np.where(better, word, best_word)
+            best_layout = np.where(better, layout, best_layout)
+
+    if quality == QUALITY_EXHAUSTIVE:
+        # Search the base colours of the layout each block ended up with
+        for layout, (flip, diff) in enumerate(layouts):
+            selected = np.flatnonzero(best_layout == layout)
+            if len(selected) == 0:
+                continue
+
+            error, word = encode_layout(pixels[selected], flip, diff[selected], True)
+
+            better = error < best_error[selected]
+            best_error[selected] = np.where(better, error, best_error[selected])
+            best_word[selected] = np.where(better, word, best_word[selected])
+
+    if not has_alpha_channel:
+        return best_word[:, None]
+
+    # 4 bits alpha per pixel, rounded like the colours
+    alphas = np.rint(pixels[:, :, 3] * 15 / 255).astype(np.uint64)
+    alpha_word = np.zeros(len(pixels), dtype=np.uint64)
+    for bit in range(16):
+        alpha_word |= alphas[:, bit] << np.uint64(4 * bit)
+
+    return np.stack([alpha_word, best_word], axis=1)
+
+def compress_blocks(pixels, has_alpha_channel, quality=QUALITY_MEDIUM):
+    """
+    Encode (blocks, 16, 4) RGBA pixels to ETC1 or ETC1A4.
+    The 16 pixels of each block are in the order decompress_blocks returns them.
+    """
+    if quality not in (QUALITY_FAST, QUALITY_MEDIUM, QUALITY_EXHAUSTIVE):
+        raise ValueError(f"Unknown ETC1 quality {quality}")
+
+    # Back to bit index order
+    ordered = np.empty_like(pixels)
+    ordered[:, PIXEL_ORDER] = pixels
+
+    chunks = [ordered[i:i + CHUNK_BLOCKS] for i in range(0, len(ordered), CHUNK_BLOCKS)]
+
+    words = [compress_chunk(chunk, has_alpha_channel, quality) for chunk in chunks]
+
+    if not words:
+        return b''
+
+    return np.concatenate(words).astype('<u8').tobytes()
+
+def psnr(pixels, decoded, has_alpha_channel):
+    # Peak signal to noise ratio in dB between RGBA pixels and decoded RGB(A) bytes
+    channels = 4 if has_alpha_channel else 3
+    original = np.asarray(pixels, dtype=np.float64).reshape(-1, 4)[:, :channels]
+    decoded = np.frombuffer(decoded, dtype=np.uint8).reshape(-1, channels)
+
+    mse = np.mean((original - decoded) ** 2) if len(original) else 0
+    if mse == 0:
+        return math.inf
+
+    return 10 * math.log10(255 * 255 / mse)
 
 class ETC1Decoder:
     @staticmethod
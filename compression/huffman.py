@@ -1,11 +1,133 @@
 import io
+import sys
+import heapq
 import struct
+import numpy as np
+
+from array import array
+from collections import Counter
 
 class NibbleOrder:
     LowNibbleFirst = 0
     HighNibbleFirst = 1
 
+def read_header(data, bit_depth):
+    huffman_mode = 2 if bit_depth == 4 else 3
+    if (data[0] & 0x7) != huffman_mode:
+        raise ValueError(f"Level5 Huffman{bit_depth}")
+
+    return (data[0] >> 3) | (data[1] << 5) | (data[2] << 13) | (data[3] << 21)
+
+class DecodingTable:
+    """
+    Byte-wide decoding table of a Huffman tree.
+    A state is the tree_buffer index of the node the decoder stands on
+    (len(tree_buffer) for the root). For every state and input byte, the
+    table holds the symbols completed by those 8 bits and the next state.
+    Entries are built from two nibble walks the first time they are met.
+    """
+
+    def __init__(self, tree_buffer, tree_root):
+        self.tree_buffer = tree_buffer
+        self.tree_root = tree_root
+        self.root_state = len(tree_buffer)
+        self.rows = [None] * (len(tree_buffer) + 1)
+        self.nibble_rows = [None] * (len(tree_buffer) + 1)
+
+    def row(self, state):
+        if self.rows[state] is None:
+            self.rows[state] = [None] * 256
+
+        return self.rows[state]
+
+    def walk(self, state, value, bits):
+        tree_buffer = self.tree_buffer
+
+        if state == self.root_state:
+            pos, next_val = self.tree_root, 0
+        else:
+            pos, next_val = tree_buffer[state], (state & ~1) + 2
+
+        symbols = bytearray()
+        for i in range(bits - 1, -1, -1):
+            next_val += ((pos & 0x3F) << 1) + 2
+            direction = 2 if (value >> i) & 1 == 0 else 1
+            leaf = (pos >> 5 >> direction) % 2 != 0
+
+            state = next_val - direction
+            pos = tree_buffer[state]
+
+            if leaf:
+                symbols.append(pos)
+                pos, next_val = self.tree_root, 0
+                state = self.root_state
+
+        return bytes(symbols), state
+
+    def nibble(self, state, value):
+        if self.nibble_rows[state] is None:
+            self.nibble_rows[state] = [None] * 16
+
+        nibble_row = self.nibble_rows[state]
+        if nibble_row[value] is None:
+            nibble_row[value] = self.walk(state, value, 4)
+
+        return nibble_row[value]
+
+    def entry(self, state, byte):
+        high_symbols, state = self.nibble(state, byte >> 4)
+        low_symbols, state = self.nibble(state, byte & 0xF)
+
+        return high_symbols + low_symbols, self.row(state), state
+
 def decompress(data, bit_depth):
+    decompressed_size = read_header(data, bit_depth)
+    symbol_count = decompressed_size * 8 // bit_depth
+
+    tree_size = data[4]
+    tree_root = data[5]
+    tree_buffer = bytes(data[6:6 + tree_size * 2])
+
+    # The bitstream is made of little-endian 32-bit words read from the most
+    # significant bit, swap them once so it can be read byte by byte
+    stream = data[6 + tree_size * 2:]
+    words = array('I')
+    words.frombytes(stream[:len(stream) // 4 * 4])
+    if sys.byteorder == 'little':
+        words.byteswap()
+
+    table = DecodingTable(tree_buffer, tree_root)
+    state = table.root_state
+    row = table.row(state)
+    result = bytearray()
+
+    try:
+        for byte in words.tobytes():
+            entry = row[byte]
+            if entry is None:
+                entry = row[byte] = table.entry(state, byte)
+
+            symbols, row, state = entry
+            result += symbols
+    except IndexError:
+        # Padding bits can walk out of the tree once every symbol is decoded
+        if len(result) < symbol_count:
+            raise ValueError(f"Truncated Level5 Huffman{bit_depth} stream")
+
+    if len(result) < symbol_count:
+        raise ValueError(f"Truncated Level5 Huffman{bit_depth} stream")
+
+    # Padding bits can decode symbols past the end
+    del result[symbol_count:]
+
+    if bit_depth == 8:
+        return bytes(result)
+
+    # Nibbles are stored low nibble first
+    nibbles = np.frombuffer(bytes(result), dtype=np.uint8)
+    return (nibbles[0::2] | (nibbles[1::2] << 4)).astype(np.uint8).tobytes()
+
+def decompress_bitwise(data, bit_depth):
     def decode_headerless(input_stream, output_stream, decompressed_size):
         nibble_order = NibbleOrder.LowNibbleFirst 
         result = bytearray(decompressed_size * 8 // bit_depth)
@@ -68,3 +190,136 @@ def decompress(data, bit_depth):
         decode_headerless(input_stream, output_stream, decompressed_size)
 
         return output_stream.getvalue()
+
+def split_nibbles(data):
+    # One symbol per nibble, low nibble first
+    values = np.frombuffer(bytes(data), dtype=np.uint8)
+    nibbles = np.empty(len(values) * 2, dtype=np.uint8)
+    nibbles[0::2] = values & 0xF
+    nibbles[1::2] = values >> 4
+
+    return nibbles.tobytes()
+
+def build_tree(symbols, bit_depth):
+    """
+    Build a Huffman tree from the symbol frequencies.
+    Leaves are symbol values, internal nodes are (child0, child1) tuples.
+    """
+    frequencies = Counter(symbols)
+
+    # The tree needs at least two leaves
+    for symbol in range(1 << bit_depth):
+        if len(frequencies) >= 2:
+            break
+        if symbol not in frequencies:
+            frequencies[symbol] = 0
+
+    # The insertion order breaks ties so the tree doesn't depend on dict order
+    heap = [(weight, order, symbol) for order, (symbol, weight) in enumerate(sorted(frequencies.items()))]
+    heapq.heapify(heap)
+    order = len(heap)
+
+    while len(heap) > 1:
+        weight0, _, node0 = heapq.heappop(heap)
+        weight1, _, node1 = heapq.heappop(heap)
+        heapq.heappush(heap, (weight0 + weight1, order, (node0, node1)))
+        order += 1
+
+    return heap[0][2]
+
+def node_flags(node):
+    # Bit 7 and bit 6 tell if the first and the second child are leaves
+    return (0 if isinstance(node[0], tuple) else 0x80) | (0 if isinstance(node[1], tuple) else 0x40)
+
+def write_tree(root):
+    """
+    Lay the tree out as pairs of slots. A node can only point 63 pairs
+    ahead, so the children of the most recently placed node are written
+    first to keep the tree compact, unless that would make another node
+    miss its limit, then the most urgent node goes first.
+    """
+    tree_buffer = bytearray()
+    pending = []
+
+    def place(node, pair):
+        tree_buffer.extend(bytes(2))
+
+        for i, child in enumerate(node):
+            slot = pair * 2 + i
+            if isinstance(child, tuple):
+                # (last pair allowed for its children, slot, node)
+                pending.append((pair + 64, slot, child))
+            else:
+                tree_buffer[slot] = child
+
+    def feasible(deadlines, pair):
+        return all(deadline >= pair + i for i, deadline in enumerate(sorted(deadlines)))
+
+    place(root, 0)
+    pair = 1
+
+    while pending:
+        latest = pending[-1]
+        deadlines = [deadline for deadline, _, _ in pending[:-1]]
+        deadlines += [pair + 64] * sum(isinstance(child, tuple) for child in latest[2])
+
+        if feasible(deadlines, pair + 1):
+            index = len(pending) - 1
+        else:
+            index = min(range(len(pending)), key=lambda i: pending[i][0])
+
+        deadline, slot, node = pending.pop(index)
+        if deadline < pair:
+            raise ValueError("Huffman tree too wide for the Level5 tree format")
+
+        tree_buffer[slot] = node_flags(node) | (pair - slot // 2 - 1)
+        place(node, pair)
+        pair += 1
+
+    return node_flags(root), tree_buffer
+
+def tree_codes(root):
+    # Code of each symbol as a string of bits
+    codes = {}
+    stack = [(root, "")]
+
+    while stack:
+        node, code = stack.pop()
+        if isinstance(node, tuple):
+            stack.append((node[0], code + "0"))
+            stack.append((node[1], code + "1"))
+        else:
+            codes[node] = code
+
+    return codes
+
+def compress(data, bit_depth):
+    symbols = split_nibbles(data) if bit_depth == 4 else bytes(data)
+
+    root = build_tree(symbols, bit_depth)
+    tree_root, tree_buffer = write_tree(root)
+
+    # The bitstream starts 4-byte aligned, so the pair count must be odd
+    tree_size = len(tree_buffer) // 2
+    if tree_size % 2 == 0:
+        tree_buffer.extend(bytes(2))
+        tree_size += 1
+
+    if tree_size > 0xFF:
+        raise ValueError("Huffman tree too large for the Level5 tree format")
+
+    # Codes are written from the most significant bit of little-endian 32-bit words
+    codes = tree_codes(root)
+    bits = "".join(map(codes.__getitem__, symbols))
+    bits += "0" * (-len(bits) % 32)
+
+    words = array('I')
+    if bits:
+        words.frombytes(int(bits, 2).to_bytes(len(bits) // 8, 'big'))
+    if sys.byteorder == 'little':
+        words.byteswap()
+
+    huffman_mode = 2 if bit_depth == 4 else 3
+    header = struct.pack('<I', len(data) << 3 | huffman_mode)
+
+    return header + bytes([tree_size, tree_root]) + bytes(tree_buffer) + words.tobytes()
@@ -1,6 +1,256 @@
 import struct
+import numpy as np
 
-def compress(data: bytes) -> bytes:
+# LZ10 format limits: 12-bit displacement and 4-bit length (3 to 18 bytes)
+WINDOW_SIZE = 0x1000
+MIN_MATCH = 3
+MAX_MATCH = 18
+
+# Compression levels: chain length of the matcher and parsing strategy.
+# "fast" and "normal" take the longest match greedily, "max" runs an
+# optimal parse that picks the cheapest sequence of literals and matches.
+LEVEL_FAST = "fast"
+LEVEL_NORMAL = "normal"
+LEVEL_MAX = "max"
+
+MAX_CHAIN = {
+    LEVEL_FAST: 8,
+    LEVEL_NORMAL: 64,
+    LEVEL_MAX: 256,
+}
+
+# Cost in bits of each token, flag bit included
+LITERAL_COST = 9
+MATCH_COST = 17
+
+# Build the whole match index at once with numpy (prefix_chain), False inserts
+# positions one by one (hash_chain). Both give the same output.
+USE_NUMPY_INDEX = True
+
+def hash_chain(data, max_chain):
+    """
+    Index every position of the sliding window by its 3-byte prefix.
+    Positions sharing a prefix are linked together, so a search only
+    checks a bounded number of candidates instead of scanning the window.
+    Returns the `insert(pos)` and `search(pos)` functions of the index.
+    """
+    size = len(data)
+
+    # head[prefix] is the most recent position starting with prefix,
+    # prev[pos] is the previous position starting with the same prefix
+    head = {}
+    prev = [-1] * size
+
+    def insert(pos):
+        if pos + MIN_MATCH <= size:
+            prefix = data[pos:pos + MIN_MATCH]
+            prev[pos] = head.get(prefix, -1)
+            head[prefix] = pos
+
+    def search(pos):
+        max_len = min(MAX_MATCH, size - pos)
+        if max_len < MIN_MATCH:
+            return 0, 0
+
+        window_start = max(0, pos - WINDOW_SIZE)
+        candidate = head.get(data[pos:pos + MIN_MATCH], -1)
+        chain = max_chain
+
+        best_pos = best_len = 0
+        while candidate >= window_start and chain > 0:
+            # A candidate can only win if it also matches the byte after the best match
+            if data[candidate + best_len] == data[pos + best_len]:
+                length = MIN_MATCH
+                while length < max_len and data[candidate + length] == data[pos + length]:
+                    length += 1
+
+                if length > best_len:
+                    best_pos, best_len = candidate, length
+                    if length == max_len:
+                        break
+
+            candidate = prev[candidate]
+            chain -= 1
+
+        return best_pos, best_len
+
+    return insert, search
+
+def prefix_chain(data):
+    """
+    Same index as hash_chain, built for every position at once:
+    prev[pos] is the closest position before pos starting with the same
+    3 bytes. Every position a parser reaches has all the previous ones
+    inserted, so searching this chain finds exactly the same matches.
+    """
+    size = len(data)
+    prev = np.full(size, -1, dtype=np.int64)
+
+    if size >= MIN_MATCH:
+        values = np.frombuffer(data, dtype=np.uint8).astype(np.int32)
+        prefixes = values[:-2] << 16 | values[1:-1] << 8 | values[2:]
+
+        # A stable sort keeps positions sharing a prefix in increasing order
+        order = np.argsort(prefixes, kind='stable')
+        same = prefixes[order[1:]] == prefixes[order[:-1]]
+        prev[order[1:][same]] = order[:-1][same]
+
+    return prev.tolist()
+
+def chain_search(data, prev, max_chain):
+    # search(pos) of hash_chain over a chain built by prefix_chain
+    size = len(data)
+
+    def search(pos):
+        max_len = min(MAX_MATCH, size - pos)
+        if max_len < MIN_MATCH:
+            return 0, 0
+
+        window_start = max(0, pos - WINDOW_SIZE)
+        candidate = prev[pos]
+        chain = max_chain
+
+        best_pos = best_len = 0
+        while candidate >= window_start and chain > 0:
+            if data[candidate + best_len] == data[pos + best_len]:
+                length = MIN_MATCH
+                while length < max_len and data[candidate + length] == data[pos + length]:
+                    length += 1
+
+                if length > best_len:
+                    best_pos, best_len = candidate, length
+                    if length == max_len:
+                        break
+
+            candidate = prev[candidate]
+            chain -= 1
+
+        return best_pos, best_len
+
+    return search
+
+def matcher(data, max_chain):
+    # insert is None when the index is built up front
+    if USE_NUMPY_INDEX:
+        return None, chain_search(data, prefix_chain(data), max_chain)
+
+    return hash_chain(data, max_chain)
+
+def greedy_parse(data, max_chain):
+    # Take the longest match at each position, as a list of (length, displacement)
+    insert, search = matcher(data, max_chain)
+    parse = []
+    current = 0
+
+    while current < len(data):
+        match_pos, match_len = search(current)
+
+        if match_len >= MIN_MATCH:
+            parse.append((match_len, current - match_pos - 1))
+            if insert:
+                for pos in range(current, current + match_len):
+                    insert(pos)
+            current += match_len
+        else:
+            parse.append((1, 0))
+            if insert:
+                insert(current)
+            current += 1
+
+    return parse
+
+def optimal_parse(data, max_chain):
+    # Find the longest match at every position
+    insert, search = matcher(data, max_chain)
+
+    if insert:
+        matches = []
+        for pos in range(len(data)):
+            matches.append(search(pos))
+            insert(pos)
+    else:
+        matches = [search(pos) for pos in range(len(data))]
+
+    # cost[pos] is the smallest size in bits needed to encode data[pos:],
+    # any length up to the longest match is a valid match at the same displacement
+    size = len(data)
+    cost = [0] * (size + 1)
+    choice = [1] * size
+
+    for pos in range(size - 1, -1, -1):
+        best_cost = cost[pos + 1] + LITERAL_COST
+        best_len = 1
+
+        match_len = matches[pos][1]
+        for length in range(MIN_MATCH, match_len + 1):
+            match_cost = cost[pos + length] + MATCH_COST
+            if match_cost <= best_cost:
+                best_cost, best_len = match_cost, length
+
+        cost[pos] = best_cost
+        choice[pos] = best_len
+
+    parse = []
+    current = 0
+
+    while current < size:
+        length = choice[current]
+
+        if length >= MIN_MATCH:
+            parse.append((length, current - matches[current][0] - 1))
+        else:
+            parse.append((1, 0))
+
+        current += length
+
+    return parse
+
+def write_parse(data, parse):
+    result = bytearray()
+    current = 0
+
+    for block in range(0, len(parse), 8):
+        block_flags = 0
+
+        # We'll go back and fill in block_flags at the end of the loop
+        block_flags_offset = len(result)
+        result.append(0)
+
+        for i, (length, disp) in enumerate(parse[block:block + 8]):
+            if length >= MIN_MATCH:
+                block_flags |= 1 << (7 - i)
+                result.append(((length - MIN_MATCH) << 4) | (disp >> 8))
+                result.append(disp & 0xFF)
+            else:
+                result.append(data[current])
+
+            current += length
+
+        # The last block is padded with empty literals
+        for i in range(len(parse[block:block + 8]), 8):
+            result.append(0)
+
+        result[block_flags_offset] = block_flags
+
+    return struct.pack('<I', len(data) << 3 | 0x1) + bytes(result)
+
+def compress(data: bytes, level=LEVEL_NORMAL) -> bytes:
+    """
+    Compress `data` to Level-5 LZ10.
+    `level` trades speed for size, see LEVEL_FAST, LEVEL_NORMAL and LEVEL_MAX.
+    """
+    data = bytes(data)
+
+    if level == LEVEL_MAX:
+        parse = optimal_parse(data, MAX_CHAIN[level])
+    elif level in MAX_CHAIN:
+        parse = greedy_parse(data, MAX_CHAIN[level])
+    else:
+        raise ValueError(f"Unknown LZ10 level {level}")
+
+    return write_parse(data, parse)
+
+def compress_binary_search(data: bytes) -> bytes:
     def compressionSearch(pos):
         """
         Find the longest match in `data` (nonlocal) at or after `pos`.
@@ -40,23 +290,17 @@ def compress(data: bytes) -> bytes:
                 lower = matchLen + 1
 
         return recordMatchPos, recordMatchLen
-    
+
     result = bytearray()
 
     current = 0 # Index of current byte to compress
 
-    ignorableDataAmount = 0
-    ignorableCompressedAmount = 0
-
-    bestSavingsSoFar = 0
-    
     while current < len(data):
         blockFlags = 0
 
         # We'll go back and fill in blockFlags at the end of the loop.
         blockFlagsOffset = len(result)
         result.append(0)
-        ignorableCompressedAmount += 1
 
         for i in range(8):
 
@@ -77,21 +321,10 @@ def compress(data: bytes) -> bytes:
                 result.append(searchDisp & 0xFF)
                 current += searchLen
 
-                ignorableDataAmount += searchLen
-                ignorableCompressedAmount += 2
-
             else:
                 result.append(data[current])
                 current += 1
-                ignorableDataAmount += 1
-                ignorableCompressedAmount += 1
-
-            savingsNow = current - len(result)
-            if savingsNow > bestSavingsSoFar:
-                ignorableDataAmount = 0
-                ignorableCompressedAmount = 0
-                bestSavingsSoFar = savingsNow
 
         result[blockFlagsOffset] = blockFlags
-      
+
     return struct.pack('<I', len(data) << 3 | 0x1) + bytes(result)
@@ -1,6 +1,61 @@
 import struct
 
 def lzss_decompress(data):
+    # Decompressed size from the 4-byte header, the output is written in place
+    size = int.from_bytes(data[:4], 'little') >> 3
+    output = bytearray(size)
+
+    p = 4
+    op = 0
+    end = len(data)
+
+    while op < size and p < end:
+        flag = data[p]
+        p += 1
+
+        if flag == 0:
+            # Block of 8 literals, copied at once
+            count = min(8, size - op, end - p)
+            output[op:op + count] = data[p:p + count]
+            p += count
+            op += count
+            continue
+
+        mask = 0x80
+        while mask and op < size:
+            if (flag & mask) == 0:
+                if p >= end:
+                    break
+                output[op] = data[p]
+                p += 1
+                op += 1
+            else:
+                if p + 2 > end:
+                    break
+                dat = (data[p] << 8) | data[p + 1]
+                p += 2
+                pos = (dat & 0x0FFF) + 1
+                length = min((dat >> 12) + 3, size - op)
+                start = op - pos
+
+                if start >= 0:
+                    if pos >= length:
+                        # Back-reference doesn't overlap the bytes being written
+                        output[op:op + length] = output[start:start + length]
+                    else:
+                        # Overlapping run, the last `pos` bytes repeat
+                        pattern = output[start:op]
+                        output[op:op + length] = (pattern * (length // pos + 1))[:length]
+                    op += length
+
+            mask >>= 1
+
+    if op < size:
+        del output[op:]
+
+    return bytes(output)
+
+def lzss_decompress_bytewise(data):
     output = []
     p = 4
     op = 0
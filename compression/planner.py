@@ -0,0 +1,209 @@
+import math
+import time
+
+from collections import Counter
+from . import lz10, rle, compressor
+
+__all__ = ["METHOD_NAMES", "STRATEGY_LZ10", "STRATEGY_FAST", "STRATEGY_SMALL", "Planner"]
+
+# Level-5 compression methods, as stored in the low 3 bits of the header
+METHOD_NAMES = {
+    0: "Raw",
+    1: "LZ10",
+    2: "Huffman4",
+    3: "Huffman8",
+    4: "RLE",
+    5: "Zlib",
+}
+
+# Strategies: "lz10" always uses LZ10 like the exporters always did,
+# "fast" picks the cheapest codec that is about as good as the best one,
+# "small" trial-compresses the most promising codecs and keeps the smallest
+STRATEGY_LZ10 = "lz10"
+STRATEGY_FAST = "fast"
+STRATEGY_SMALL = "small"
+
+# Encoding cost order, cheapest first
+ENCODE_COST = [0, 5, 4, 3, 2, 1]
+
+# LZ10 level used by each strategy
+LZ10_LEVELS = {
+    STRATEGY_LZ10: lz10.LEVEL_NORMAL,
+    STRATEGY_FAST: lz10.LEVEL_FAST,
+    STRATEGY_SMALL: lz10.LEVEL_MAX,
+}
+
+# Payloads bigger than this are estimated on evenly spaced chunks
+SAMPLE_SIZE = 0x4000
+SAMPLE_CHUNKS = 8
+
+def sample(data, sample_size=SAMPLE_SIZE, chunk_count=SAMPLE_CHUNKS):
+    if len(data) <= sample_size:
+        return bytes(data)
+
+    chunk_size = sample_size // chunk_count
+    step = len(data) // chunk_count
+
+    return b''.join(data[i * step:i * step + chunk_size] for i in range(chunk_count))
+
+def analyze(data):
+    """
+    Estimate how compressible `data` is from a sample.
+    Returns the byte entropy (bits per byte) and the fraction of bytes
+    that belong to runs of 3 identical bytes or more.
+    """
+    data = sample(data)
+    if not data:
+        return {"entropy": 0.0, "run_fraction": 0.0}
+
+    entropy = 0.0
+    for count in Counter(data).values():
+        probability = count / len(data)
+        entropy -= probability * math.log2(probability)
+
+    run_bytes = sum(match.end() - match.start() for match in rle.RUN_PATTERN.finditer(data))
+
+    return {"entropy": entropy, "run_fraction": run_bytes / len(data)}
+
+class Planner:
+    """
+    Choose the compression method of each payload written by an export
+    and keep the statistics of every choice.
+    """
+
+    def __init__(self, strategy=STRATEGY_LZ10, allow_zlib=False, cache=None):
+        self.strategy = strategy
+        self.allow_zlib = allow_zlib
+
+        # Optional CompressionCache, unchanged payloads are then only hashed
+        self.cache = cache
+
+        # Not every title reads zlib payloads, so it has to be asked for
+        self.methods = [0, 1, 2, 3, 4, 5] if allow_zlib else [0, 1, 2, 3, 4]
+        self.stats = []
+
+    def estimate(self, data, analysis):
+        # Compressed size ratio of each method on a sample of `data`
+        data = sample(data)
+        if not data:
+            return {0: 1.0}
+
+        estimates = {}
+        for method in self.methods:
+            if method == 0:
+                estimates[method] = 1.0
+            elif method == 1:
+                estimates[method] = (len(lz10.compress(data, lz10.LEVEL_FAST)) - 4) / len(data)
+            elif method == 3:
+                # Close enough to the real size without building the bitstream
+                estimates[method] = analysis["entropy"] / 8 + 0x200 / len(data)
+            elif method == 4 and analysis["run_fraction"] < 0.1:
+                # Almost no runs, RLE can only add literal headers
+                continue
+            else:
+                try:
+                    estimates[method] = (len(compressor.compress(data, method)) - 4) / len(data)
+                except ValueError:
+                    # Huffman tree that the format can't store
+                    pass
+
+        return estimates
+
+    def choose(self, data, analysis):
+        if self.strategy == STRATEGY_LZ10:
+            return [1]
+
+        estimates = self.estimate(data, analysis)
+        best = min(estimates.values())
+
+        if self.strategy == STRATEGY_FAST:
+            # Cheapest method within 10% of the best estimate
+            for method in ENCODE_COST:
+                if method in estimates and estimates[method] <= best * 1.1 + 0.01:
+                    return [method]
+
+        # Two best estimates, raw is kept as the fallback
+        candidates = sorted(estimates, key=lambda method: estimates[method])[:2]
+        if 0 not in candidates:
+            candidates.append(0)
+
+        return candidates
+
+    def encode(self, data, method):
+        if method == 1:
+            return lz10.compress(data, LZ10_LEVELS[self.strategy])
+
+        return compressor.compress(data, method)
+
+    def copy(self):
+        # Same settings without the statistics, for another process
+        return Planner(self.strategy, self.allow_zlib, self.cache)
+
+    def plan(self, data):
+        # Compress `data` with the method chosen by the strategy
+        analysis = analyze(data) if self.strategy != STRATEGY_LZ10 else {}
+
+        output = None
+        for method in self.choose(data, analysis):
+            try:
+                compressed = self.encode(data, method)
+            except ValueError:
+                continue
+
+            if output is None or len(compressed) < len(output):
+                output = compressed
+
+        if output is None:
+            output = self.encode(data, 1)
+
+        return output, analysis
+
+    def compress(self, data, name="", **details):
+        # `details` are added to the statistics of the payload, like the PSNR of a texture
+        start = time.perf_counter()
+        data = bytes(data)
+
+        output = None
+        analysis = {}
+
+        if self.cache is not None:
+            key = self.cache.key(data, f"{self.strategy}:{self.allow_zlib}")
+            output = self.cache.get(key, len(data))
+
+        cached = output is not None
+        if not cached:
+            output, analysis = self.plan(data)
+
+            if self.cache is not None:
+                self.cache.put(key, output)
+
+        stat = {
+            "name": name,
+            "method": output[0] & 0x7,
+            "size": len(data),
+            "compressed_size": len(output),
+            "seconds": time.perf_counter() - start,
+            "cached": cached,
+        }
+        stat.update(analysis)
+        stat.update(details)
+        self.stats.append(stat)
+
+        return output
+
+    def summary(self):
+        lines = []
+        for stat in self.stats:
+            ratio = stat["compressed_size"] / stat["size"] if stat["size"] else 1.0
+            line = f"{stat['name']:<32} {METHOD_NAMES[stat['method']]:<9} {stat['size']:>9} -> {stat['compressed_size']:>9} ({ratio:6.1%}) {stat['seconds']:7.3f}s{' cached' if stat.get('cached') else ''}"
+            if "psnr" in stat:
+                line += f" PSNR {stat['psnr']:.2f} dB ({stat['quality']}, encoded in {stat['encode_seconds']:.3f}s)"
+            lines.append(line)
+
+        size = sum(stat["size"] for stat in self.stats)
+        compressed_size = sum(stat["compressed_size"] for stat in self.stats)
+        seconds = sum(stat["seconds"] for stat in self.stats)
+        cached = sum(1 for stat in self.stats if stat.get("cached"))
+        lines.append(f"{len(self.stats)} payloads ({cached} cached), {size} -> {compressed_size} bytes in {seconds:.3f}s ({self.strategy})")
+
+        return lines
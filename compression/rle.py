@@ -1,6 +1,126 @@
 import io
+import re
+import struct
+
+# Runs of 3 bytes or more, any byte value
+RUN_PATTERN = re.compile(rb'(.)\1{2,}', re.DOTALL)
+
+def read_header(data):
+    if data[0] & 0x7 != 0x4:
+        raise Exception("Not Level5 Rle")
+
+    return struct.unpack_from('<I', data)[0] >> 3
 
 def decompress(input_bytes):
+    """
+    Decode Level-5 RLE with one slice per run or literal block.
+    """
+    data = bytes(input_bytes)
+    decompressed_size = read_header(data)
+
+    # Extending a bytearray is cheaper than assigning slices of a preallocated one,
+    # see benchmark.decompress_rle_preallocated
+    output = bytearray()
+    extend = output.extend
+    pos = 4
+    end = len(data)
+
+    while pos < end:
+        flag = data[pos]
+
+        if flag & 0x80:
+            # Run of 3 to 130 bytes
+            extend(data[pos + 1:pos + 2] * (flag - 0x7D))
+            pos += 2
+        else:
+            # 1 to 128 literals
+            pos += 1
+            extend(data[pos:pos + flag + 1])
+            pos += flag + 1
+
+    if len(output) < decompressed_size:
+        raise ValueError("Truncated Level5 Rle stream")
+
+    # Drop the padding decoded after the last block
+    del output[decompressed_size:]
+
+    return bytes(output)
+
+def decompress_stream(input_bytes, chunk_size=0x10000):
+    """
+    Decode Level-5 RLE chunk by chunk.
+    Every `chunk_size` bytes of input are decoded and copied into one output
+    buffer allocated from the size in the header, and a memoryview of the
+    new bytes is yielded, so a big payload can be fed to a parser while it
+    is decoded. The views stay valid after the next chunk is decoded.
+    """
+    data = bytes(input_bytes)
+    size = read_header(data)
+
+    output = memoryview(bytearray(size))
+    written = 0
+
+    # Blocks are decoded like in decompress, only the input position is checked per block
+    chunk = bytearray()
+    extend = chunk.extend
+    pos = 4
+    end = len(data)
+
+    while pos < end and written < size:
+        stop = min(pos + chunk_size, end)
+
+        while pos < stop:
+            flag = data[pos]
+
+            if flag & 0x80:
+                extend(data[pos + 1:pos + 2] * (flag - 0x7D))
+                pos += 2
+            else:
+                pos += 1
+                extend(data[pos:pos + flag + 1])
+                pos += flag + 1
+
+        # Drop the padding decoded after the last block
+        length = min(len(chunk), size - written)
+        output[written:written + length] = chunk if length == len(chunk) else chunk[:length]
+        chunk.clear()
+
+        yield output[written:written + length]
+        written += length
+
+    if written < size:
+        raise ValueError("Truncated Level5 Rle stream")
+
+def compress(data):
+    data = bytes(data)
+    output = bytearray(struct.pack('<I', len(data) << 3 | 0x4))
+
+    def write_literals(literals):
+        # Up to 128 bytes per literal block
+        for i in range(0, len(literals), 0x80):
+            block = literals[i:i + 0x80]
+            output.append(len(block) - 1)
+            output.extend(block)
+
+    literal_start = 0
+    for match in RUN_PATTERN.finditer(data):
+        start, end = match.span()
+        write_literals(data[literal_start:start])
+
+        # Up to 130 bytes per run, a tail shorter than 3 bytes goes to the next literals
+        while end - start >= 3:
+            repetitions = min(end - start, 0x82)
+            output.append(0x80 | (repetitions - 3))
+            output.append(data[start])
+            start += repetitions
+
+        literal_start = start
+
+    write_literals(data[literal_start:])
+
+    return bytes(output)
+
+def decompress_bytewise(input_bytes):
     input_stream = io.BytesIO(input_bytes)
     compression_header = input_stream.read(4)
     
@@ -8,4 +8,4 @@ def zlib_decompress(data):
         return False
         
 def zlib_compress(data):
-    return struct.pack('<I', len(data) << 3 | 0x1) + zlib.compress(data)
\ No newline at end of file
+    return struct.pack('<I', len(data) << 3 | 0x5) + zlib.compress(data)
\ No newline at end of file
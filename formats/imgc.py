@@ -4,42 +4,49 @@ import numpy as np
 
 from ..utils import *
 from ..compression import *
+from ..compression.planner import Planner
 
 ##########################################
 # IMGC Write Function
 ##########################################
 
 def flip_vertically(pixels, height, width):
-    transposed_pixels = []
-    for y in range(height):
-        for x in range(width):
-            index = y * width + x
-            transposed_index = (height - y - 1) * width + x
-            transposed_pixels.append(pixels[transposed_index])
-    return transposed_pixels
-    
+    # Rows in the opposite order, pixels is an array of width * height pixels
+    return pixels.reshape(height, width, -1)[::-1].reshape(pixels.shape)
+
 def get_pixels(img):
-    px = []
+    width, height = img.size
+
+    # Copied straight into a float32 buffer, without a python float per value
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    img.pixels.foreach_get(pixels)
+
+    np.clip(pixels, 0.0, 1.0, out=pixels)
+    pixels *= 255
+
+    return flip_vertically(pixels.astype(np.uint8).reshape(-1, 4), height, width)
     
-    img_pixels = list(img.pixels)
-    for i in range(0, len(img_pixels), 4):
-        px.append([int(img_pixels[i]*255), int(img_pixels[i+1]*255), int(img_pixels[i+2]*255), int(img_pixels[i+3]*255)])
-     
-    return flip_vertically(px, img.size[1], img.size[0])
+def write(img, img_format, planner=None):
+    return write_pixels(img.name, get_pixels(img), img.size[0], img.size[1], img_format, planner)
+
+def write_pixels(name, px, width, height, img_format, planner=None):
+    if planner is None:
+        planner = Planner()
 
-def write(img, img_format):
     out = bytes()
-    
-    height = img.size[1]
-    width = img.size[0]
-    px = get_pixels(img)
 
-    tile_compress = lz10.compress(image_to_tile(px, height, width))
-    image_data_compress = lz10.compress(encode_image(px, height, width, img_format))
+    tile_data, image_data, details = encode_texture(px, height, width, img_format)
+    tile_compress = planner.compress(tile_data, name + ".tile")
+    image_data_compress = planner.compress(image_data, name + ".image", **details)
+
+    # Bits per pixel and bytes per 8x8 tile
+    bit_depth = img_format.bit_depth
 
     out += bytes.fromhex("494D4743303000003000")
     out += int(img_format.type).to_bytes(1, 'little')
-    out += bytes.fromhex("0101108000")
+    out += bytes.fromhex("0101")
+    out += int(bit_depth).to_bytes(1, 'little')
+    out += int(bit_depth * 8).to_bytes(2, 'little')
     out += width.to_bytes(2, 'little')
     out += height.to_bytes(2, 'little')
     out += bytes.fromhex("3000000030000100480000000300000000000000000000000000000000000000")
@@ -77,9 +84,15 @@ class IMGCSupport:
             self.ImageFormats = {
                 0: img_format.RGBA8(),
                 1: img_format.RGBA4(),
+                2: img_format.RGBA5551(),
                 3: img_format.RBGR888(),
                 4: img_format.RGB565(),
+                11: img_format.LA8(),
+                12: img_format.LA4(),
+                13: img_format.L8(),
                 14: img_format.L4(),
+                15: img_format.A8(),
+                16: img_format.A4(),
                 27: img_format.ETC1(),
                 28: img_format.ETC1A4(),
             }
@@ -88,12 +101,43 @@ class IMGCSupport:
 # IMGC Open Function
 ##########################################
 
-def open(file_content):
-    data = BytesIO(file_content)
-
+def read_header(data):
     # Reading and unpacking the header data
     header_data = data.read(struct.calcsize('I6xbxbbhhh8xi20xiii8x'))
-    header = IMGCSupport.Header(struct.unpack('I6xbxbbhhh8xi20xiii8x', header_data))
+    return IMGCSupport.Header(struct.unpack('I6xbxbbhhh8xi20xiii8x', header_data))
+
+def open_header(file_content, scale=1):
+    # Size of the texture decoded at 1 / scale and whether it has alpha, without decoding it
+    header = read_header(BytesIO(file_content))
+
+    if header.ImageFormat in header.ImageFormats:
+        return img_tool.preview_size(header.Width, header.Height, scale) + (header.ImageFormats[header.ImageFormat].has_alpha,)
+    else:
+        return None
+
+def open_cached(file_content, cache, scale=1):
+    # Decoded texture from a TextureCache, None if it isn't there
+    header = open_header(file_content, scale)
+    if header is None:
+        return None
+
+    width, height, has_alpha = header
+
+    pixels = cache.get(cache.key(file_content, f"imgc:{scale}"), width * height * 4)
+    if pixels is None:
+        return None
+
+    # Same float32 values as decode_image
+    return pixels.astype(np.float32) / 255, width, height, has_alpha
+
+def open(file_content, cache=None, scale=1):
+    if cache is not None:
+        texture = open_cached(file_content, cache, scale)
+        if texture is not None:
+            return texture
+
+    data = BytesIO(file_content)
+    header = read_header(data)
 
     # Decompressing tile and image data
     data.seek(header.TileOffset)
@@ -103,6 +147,12 @@ def open(file_content):
     image_data = compressor.decompress(data.read(header.ImageSize))
 
     if header.ImageFormat in header.ImageFormats:
-        return img_tool.decode_image(tile_data, image_data, header.ImageFormats[header.ImageFormat], header.Width, header.Height, header.BitDepth)
+        texture = img_tool.decode_image(tile_data, image_data, header.ImageFormats[header.ImageFormat], header.Width, header.Height, header.BitDepth, scale)
+
+        # Stored as 8 bit values, the pixels are multiples of 1/255
+        if cache is not None:
+            cache.put(cache.key(file_content, f"imgc:{scale}"), np.rint(texture[0] * 255).astype(np.uint8))
+
+        return texture
     else:
         return None
\ No newline at end of file
@@ -0,0 +1,167 @@
+import os
+import pickle
+import multiprocessing
+import numpy as np
+
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+# Package of the addon and its folder, the workers import the formats from there
+PACKAGE = __name__.rsplit('.', 2)[0]
+PACKAGE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run by every worker before its first job.
+# The addon and formats __init__ import bpy and mathutils, which only exist
+# inside Blender, so both are registered as bare packages: the format
+# modules themselves only need utils and compression.
+WORKER_SETUP = """
+import sys
+import types
+
+for name, path in packages:
+    if name not in sys.modules:
+        module = types.ModuleType(name)
+        module.__path__ = [path]
+        sys.modules[name] = module
+"""
+
+# Failures of the pool itself, the jobs then run serially.
+# Errors raised by a job are not in there and propagate unchanged.
+POOL_ERRORS = (BrokenProcessPool, pickle.PicklingError)
+
+# With workers=0 smaller batches run serially, starting the processes
+# costs more than the work. Shared jobs also need that many output bytes.
+MIN_PARALLEL_JOBS = 4
+MIN_PARALLEL_SIZE = 0x400000
+
+def default_workers():
+    # Keep one core for Blender
+    return max(1, (os.cpu_count() or 1) - 1)
+
+def run_job(function, args, planner):
+    return function(*args, planner=planner), planner.stats
+
+def submit(executor, function, *args):
+    # The processes are started by the first submit
+    try:
+        return executor.submit(function, *args)
+    except OSError as e:
+        raise BrokenProcessPool(f"Can't start the worker processes: {e}") from e
+
+def make_executor(workers):
+    # Spawn instead of fork, forking Blender itself isn't safe
+    context = multiprocessing.get_context("spawn")
+    packages = [(PACKAGE, PACKAGE_PATH), (PACKAGE + ".formats", os.path.join(PACKAGE_PATH, "formats"))]
+    initargs = (WORKER_SETUP, {"packages": packages})
+
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=exec, initargs=initargs)
+
+def run_parallel(jobs, planner, workers):
+    with make_executor(min(workers, len(jobs))) as executor:
+        futures = [submit(executor, run_job, function, args, planner.copy()) for function, args in jobs]
+        outputs = [future.result() for future in futures]
+
+    results = []
+    for result, stats in outputs:
+        planner.stats.extend(stats)
+        results.append(result)
+
+    return results
+
+def run_jobs(jobs, planner, workers=0, report=print):
+    """
+    Run `jobs`, a list of (function, args) where function is a format writer
+    taking a `planner` keyword, and return the results in the same order.
+    `workers` is the number of processes, 0 uses every core but one unless
+    there are fewer than MIN_PARALLEL_JOBS jobs, and 1 runs the jobs in this
+    process. If the pool can't be used the jobs run serially instead and
+    report(message) is called, an error raised by a job is raised here.
+    """
+    if workers == 0:
+        workers = default_workers() if len(jobs) >= MIN_PARALLEL_JOBS else 1
+
+    if workers > 1 and len(jobs) > 1:
+        try:
+            return run_parallel(jobs, planner, workers)
+        except POOL_ERRORS as e:
+            report(f"Parallel export unavailable ({e}), exporting serially")
+
+    return [function(*args, planner=planner) for function, args in jobs]
+
+def run_shared_job(function, args, name):
+    # Copy the array returned by function into the shared memory block `name`,
+    # only the rest of the result goes back through a pipe
+    result = function(*args)
+    if result is None:
+        return None
+
+    array = np.ascontiguousarray(result[0])
+    memory = shared_memory.SharedMemory(name=name)
+
+    try:
+        if array.nbytes > memory.size:
+            raise ValueError(f"Result of {array.nbytes} bytes doesn't fit in {memory.size} bytes")
+
+        view = np.ndarray(array.shape, array.dtype, buffer=memory.buf)
+        view[:] = array
+        del view
+    finally:
+        memory.close()
+
+    return (None,) + tuple(result[1:])
+
+def run_shared_parallel(jobs, callback, workers, dtype, done):
+    # The blocks are made and freed here, so they outlive the workers
+    blocks = []
+
+    try:
+        with make_executor(min(workers, len(jobs))) as executor:
+            futures = {}
+            for index, (function, args, shape) in enumerate(jobs):
+                memory = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+                blocks.append(memory)
+                futures[submit(executor, run_shared_job, function, args, memory.name)] = (index, memory, shape)
+
+            for future in as_completed(futures):
+                index, memory, shape = futures[future]
+                result = future.result()
+
+                if result is None:
+                    callback(index, None)
+                else:
+                    view = np.ndarray(shape, dtype, buffer=memory.buf)
+                    callback(index, (view,) + result[1:])
+                    del view
+
+                done.add(index)
+    finally:
+        for memory in blocks:
+            memory.close()
+            memory.unlink()
+
+def run_shared_jobs(jobs, callback, workers=0, dtype=np.float32, report=print):
+    """
+    Run `jobs`, a list of (function, args, shape) where function returns None
+    or a tuple whose first item is an array of `shape` and `dtype`, like
+    imgc.open. callback(index, result) is called in this process as every
+    job finishes. The array then lives in shared memory and is only valid
+    during the call. `workers` and `report` work like in run_jobs, 0 workers
+    also runs serially below MIN_PARALLEL_SIZE bytes of output.
+    """
+    if workers == 0:
+        size = sum(int(np.prod(shape)) for function, args, shape in jobs) * np.dtype(dtype).itemsize
+        workers = default_workers() if len(jobs) >= MIN_PARALLEL_JOBS and size >= MIN_PARALLEL_SIZE else 1
+
+    done = set()
+
+    if workers > 1 and len(jobs) > 1:
+        try:
+            run_shared_parallel(jobs, callback, workers, dtype, done)
+            return
+        except POOL_ERRORS as e:
+            report(f"Parallel import unavailable ({e}), importing serially")
+
+    for index, (function, args, shape) in enumerate(jobs):
+        if index not in done:
+            callback(index, function(*args))
@@ -4,6 +4,7 @@ import struct
 
 from enum import Enum
 from ..compression import *
+from ..compression.planner import Planner
 
 ##########################################
 # RESType
@@ -296,7 +297,10 @@ def make_library(meshes = [], armature = None, textures = {}, animation = {}, sp
         
     return items, string_table
                 
-def write_res(magic, items, string_table):
+def write_res(magic, items, string_table, planner=None):
+    if planner is None:
+        planner = Planner()
+
     materials = {key: value for key, value in items.items() if key in materials_ordered}
     nodes = {key: value for key, value in items.items() if key in nodes_ordered}
 
@@ -367,7 +371,7 @@ def write_res(magic, items, string_table):
                 writer_res.write(writer_table.getvalue())
                 writer_res.write(writer_data.getvalue())
                 
-                return compress(writer_res.getvalue())
+                return planner.compress(writer_res.getvalue(), "RES.bin")
 
 ##########################################
 # XRES
@@ -3,8 +3,12 @@ import zlib
 import struct
 
 from ..compression import *
+from ..compression.planner import Planner
+
+def write(name, meshes, thickness, visibility, outline_mesh_data, cmb1, cmb2, planner=None):
+    if planner is None:
+        planner = Planner()
 
-def write(name, meshes, thickness, visibility, outline_mesh_data, cmb1, cmb2):
     header = {
         "magic": 0x4C534358,
         "outline_offset": 0x20,
@@ -42,7 +46,7 @@ def write(name, meshes, thickness, visibility, outline_mesh_data, cmb1, cmb2):
     for i in range(len(meshes)):
         outline_mesh_data_stream.write(zlib.crc32(meshes[i].encode("shift-jis")).to_bytes(4, 'little'))
         
-    outline_mesh_data_compress = compress(outline_mesh_data_stream.getvalue())
+    outline_mesh_data_compress = planner.compress(outline_mesh_data_stream.getvalue(), name + ".outline")
     stream.write(outline_mesh_data_compress)
 
     # Write CMB1 header
@@ -52,7 +56,7 @@ def write(name, meshes, thickness, visibility, outline_mesh_data, cmb1, cmb2):
     # Write CMB1 data
     cmb1_data_stream = io.BytesIO()
     cmb1_data_stream.write(bytes(cmb1))
-    cmb1_data_compress = compress(cmb1_data_stream.getvalue())
+    cmb1_data_compress = planner.compress(cmb1_data_stream.getvalue(), name + ".cmb1")
     stream.write(cmb1_data_compress)
     header['cmb_length1'] = len(cmb1_data_compress) + 12
 
@@ -63,7 +67,7 @@ def write(name, meshes, thickness, visibility, outline_mesh_data, cmb1, cmb2):
     # Write CMB2 data
     cmb2_data_stream = io.BytesIO()
     cmb2_data_stream.write(bytes(cmb2))
-    cmb2_data_compress = compress(cmb2_data_stream.getvalue())
+    cmb2_data_compress = planner.compress(cmb2_data_stream.getvalue(), name + ".cmb2")
     stream.write(cmb2_data_compress)
     header['cmb_length2'] = len(cmb2_data_compress) + 12
 
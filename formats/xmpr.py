@@ -1,12 +1,25 @@
 import zlib
 import struct
+import numpy as np
 from ..utils import *
 from ..compression import lz10, compressor
+from ..compression.planner import Planner
 
 ##########################################
 # XMPR Write Function
 ##########################################
 
+# One vertex of the XPVB buffer, 88 bytes
+XPVB_VERTEX = np.dtype([
+    ("position", "<f4", 3),
+    ("normal", "<f4", 3),
+    ("uv0", "<f4", 2),
+    ("uv1", "<f4", 2),
+    ("weights", "<f4", 4),
+    ("bones", "<f4", 4),
+    ("color", "<f4", 4),
+])
+
 def used_bones(weights, bone_names):
     used = {}
     
@@ -33,110 +46,80 @@ def used_weights(weights):
             
     return weights
 
-def remove_dupe_indices(indices):
-    used_indices = []
-    final_indices = []
+def weld_vertices(indices):
+    """
+    Give every distinct (v, vt, vn, vc) face corner an index in a single pass.
+    Returns the distinct corners as dicts in order of first use, as
+    write_geometrie takes them, and the faces as tuples of those indices,
+    as write_triangle takes them.
+    """
     keys = ["v", "vt", "vn", "vc"]
-    
-    for indice in indices:
-        for i in range(3):
-            geometrie = []
-            for j in indice.keys():
-                if indice[j] != []:
-                    geometrie.append(indice[j][i])
-            
-            geometrie = tuple(geometrie)
-            
-            if geometrie not in used_indices:
-                used_indices.append(geometrie)
-            
-                # Transform geometrie tuple to dict
-                geometrie = used_indices[used_indices.index(geometrie)]
-                geometrie_dict = {}
-                for i, key in enumerate(keys):
-                    if i < len(geometrie):
-                        geometrie_dict[key] = geometrie[i]
-                    else:
-                        break
-                    
-                final_indices.append(geometrie_dict)
-     
-    return final_indices
-    
-def index_of_geometrie(indices):
-    final_indices = []
-    
-    used_indices = []
-    for indice in indices:
-        for i in range(3):
-            geometrie = []
-            
-            for j in indice.keys():
-                if indice[j] != []:
-                    geometrie.append(indice[j][i])
-            
-            geometrie = tuple(geometrie)
-            
-            if geometrie not in used_indices:
-                used_indices.append(geometrie)
-                  
+
+    # Corner tuple -> index in geometries
+    geometrie_indices = {}
+    geometries = []
+    faces = []
+
     for indice in indices:
+        # Attributes the mesh has, vertex colors can be missing
+        columns = [value for value in indice.values() if value != []]
+
         face = []
-        
         for i in range(3):
-            geometrie = []
-            
-            for j in indice.keys():
-                if indice[j] != []:
-                    geometrie.append(indice[j][i])
-            
-            geometrie = tuple(geometrie)
-            face.append(used_indices.index(geometrie))
-            
-        face = tuple(face) 
-        final_indices.append(face)
-     
-    return final_indices
+            geometrie = tuple(column[i] for column in columns)
+
+            index = geometrie_indices.get(geometrie)
+            if index is None:
+                index = len(geometries)
+                geometrie_indices[geometrie] = index
+                geometries.append(dict(zip(keys, geometrie)))
+
+            face.append(index)
+
+        faces.append(tuple(face))
+
+    return geometries, faces
+
+def remove_dupe_indices(indices):
+    return weld_vertices(indices)[0]
+
+def index_of_geometrie(indices):
+    return weld_vertices(indices)[1]
 
 def write_geometrie(indices, vertices, uvs, normals, colors, weights):
-    out = bytes()
-    
-    indices = remove_dupe_indices(indices)
-    
-    for indice in indices:
-        for v in vertices[indice['v']]:
-            out += bytearray(struct.pack("f", v))
-        for n in normals[indice['vn']]:
-            out += bytearray(struct.pack("f", n))
-        for vt in range(2):
-            out += bytearray(struct.pack("f", uvs[indice['vt']][0]))
-            out += bytearray(struct.pack("f", 1 - uvs[indice['vt']][1] ))
-            
+    # indices are the distinct corners given by weld_vertices
+    buffer = np.zeros(len(indices), dtype=XPVB_VERTEX)
+    if not indices:
+        return buffer.tobytes()
+
+    buffer["position"] = [vertices[indice['v']] for indice in indices]
+    buffer["normal"] = [normals[indice['vn']] for indice in indices]
+
+    # Both UV slots hold the same UV, flipped vertically
+    uv = np.array([uvs[indice['vt']] for indice in indices], dtype=np.float64)
+    uv[:, 1] = 1 - uv[:, 1]
+    buffer["uv0"] = uv
+    buffer["uv1"] = uv
+
+    # The 4 first bones of each vertex, unused slots stay 0
+    bone_weights = buffer["weights"]
+    bone_indices = buffer["bones"]
+    for i, indice in enumerate(indices):
         weight = weights[indice['v']]
-        keys = list(weight.keys())
-        for w in range(4):
-            if w < len(keys):
-                out += bytearray(struct.pack("f", float(weight[keys[w]])))
-            else:
-                out += int(0).to_bytes(4, 'little')
-        for x in range(4):
-            if x < len(keys):
-                out += bytearray(struct.pack("f", float(keys[x])))
-            else:
-                out += int(0).to_bytes(4, 'little')
-        
-        for c in range(4):
-            if len(colors) > 0:
-                out += bytearray(struct.pack("f", colors[indice['vc']][c]))
-            else:
-                out += int(0).to_bytes(4, 'little')
-                
-    return out
+        keys = list(weight.keys())[:4]
+
+        bone_weights[i, :len(keys)] = [float(weight[key]) for key in keys]
+        bone_indices[i, :len(keys)] = keys
+
+    if len(colors) > 0:
+        buffer["color"] = [colors[indice['vc']] for indice in indices]
+
+    return buffer.tobytes()
     
 def write_triangle(indices):
+    # indices are the faces given by weld_vertices
     out = bytes()
     
-    indices = index_of_geometrie(indices)
     triangle_strip = stripify(indices, True)
     
     for i in range(len(triangle_strip)):
@@ -145,17 +128,21 @@ def write_triangle(indices):
           
     return out
                 
-def write(mesh_name, dimensions, indices, vertices, uvs, normals, colors, weights, bone_names, material_name, mode):
+def write(mesh_name, dimensions, indices, vertices, uvs, normals, colors, weights, bone_names, material_name, mode, planner=None):
+    if planner is None:
+        planner = Planner()
+
     # Get only used bones
     bone_names = used_bones(weights, bone_names)
     weights = used_weights(weights)
     
     # Get content data
-    data_geometrie = write_geometrie(indices, vertices, uvs, normals, colors, weights)
-    data_triangle = write_triangle(indices)
+    geometries, faces = weld_vertices(indices)
+    data_geometrie = write_geometrie(geometries, vertices, uvs, normals, colors, weights)
+    data_triangle = write_triangle(faces)
 
     # XPVB-------------------------------------------
-    compress_geometrie = lz10.compress(data_geometrie) 
+    compress_geometrie = planner.compress(data_geometrie, mesh_name + ".xpvb")
     xpvb = bytes()
     xpvb += bytes([int(x,0) for x in ["0x58", "0x50", "0x56", "0x42", "0x10", "0x00", "0x3C", "0x00", "0x48", "0x00", "0x58", "0x00"] ])
     xpvb += int(len(data_geometrie)/88).to_bytes(4, 'little')
@@ -163,7 +150,7 @@ def write(mesh_name, dimensions, indices, vertices, uvs, normals, colors, weight
     xpvb += compress_geometrie
 
     # XPVI-------------------------------------------
-    compress_triangle = lz10.compress(data_triangle) 
+    compress_triangle = planner.compress(data_triangle, mesh_name + ".xpvi")
     xpvi = bytes()
     xpvi += bytes([int(x,0) for x in ["0x58", "0x50", "0x56", "0x49", "0x02", "0x00", "0x0c", "0x00"] ])
     xpvi += int(len(data_triangle)/2).to_bytes(4, 'little')
@@ -239,89 +226,79 @@ def write(mesh_name, dimensions, indices, vertices, uvs, normals, colors, weight
 # XMPR Open Function
 ##########################################
 
-def read_attribute(data, offset, type, count):
-    o = (0, 0, 0, 0)
-    
-    if type == 0:  # nothing
-        pass
-    elif type == 1:  # Vec3
-        pass
-    elif type == 2:  # Vec4
-        if count > 0 and offset + 4 * count <= len(data):
-            o = struct.unpack(f"<{count}f", data[offset:offset + 4 * count])
-    else:
-        raise Exception(f"Unknown Type 0x{type:02X}")
-
-    return o
+# Attribute slots read from the XPVB buffer
+XPVB_ATTRIBUTES = {
+    0: "positions",
+    2: "normals",
+    4: "uv_data",
+    7: "weights",
+    8: "bone_indices",
+    9: "color_data",
+}
 
-def parse_buffer(buffer, node_table):
-    vertices = []
-    attribute_buffer = bytearray()
-    stride = 0
-    vertex_count = 0
+def vertex_dtype(attributes, stride):
+    # Structured dtype of one vertex, a float field for every attribute with data
+    names, formats, offsets = [], [], []
+
+    for i, name in XPVB_ATTRIBUTES.items():
+        count, offset, size, type = attributes[i]
+
+        if type not in (0, 1, 2):
+            raise Exception(f"Unknown Type 0x{type:02X}")
 
+        if type == 2 and count > 0:
+            names.append(name)
+            formats.append(('<f4', (count,)))
+            offsets.append(offset)
+
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": stride})
+
+def parse_buffer(buffer, node_table):
+    """
+    Read the vertices of an XPVB buffer into one array per attribute:
+    positions, normals, uv_data, weights, color_data and, when the mesh
+    has a node table, bone_indices as bone crc32.
+    """
     offset = 0x4
-    att_offset = struct.unpack("<H", buffer[offset:offset + 2])[0]
-    offset += 2
-    att_something = struct.unpack("<h", buffer[offset:offset + 2])[0]
-    offset += 2
-    ver_offset = struct.unpack("<H", buffer[offset:offset + 2])[0]
-    offset += 2
-    stride = struct.unpack("<h", buffer[offset:offset + 2])[0]
-    offset += 2
-    vertex_count = struct.unpack("<i", buffer[offset:offset + 4])[0]
+    att_offset, att_something, ver_offset, stride, vertex_count = struct.unpack("<HhHhi", buffer[offset:offset + 12])
 
     attribute_buffer = compressor.decompress(buffer[att_offset:att_offset + att_something])
     buffer = compressor.decompress(buffer[ver_offset:])
 
-    ACount = [0] * 10
-    AOffet = [0] * 10
-    ASize = [0] * 10
-    AType = [0] * 10
+    # Count, offset, size and type of the 10 attribute slots
+    attributes = np.frombuffer(bytes(attribute_buffer[:40]).ljust(40, b'\x00'), dtype=np.int8).reshape(10, 4).astype(np.int32)
+    attributes[:, 1] &= 0xFF
 
-    offset = 0
     for i in range(10):
-        ACount[i] = struct.unpack("<b", attribute_buffer[offset:offset + 1])[0]
-        offset += 1
-        AOffet[i] = struct.unpack("<b", attribute_buffer[offset:offset + 1])[0]
-        offset += 1
-        ASize[i] = struct.unpack("<b", attribute_buffer[offset:offset + 1])[0]
-        offset += 1
-        AType[i] = struct.unpack("<b", attribute_buffer[offset:offset + 1])[0]
-        offset += 1
-
-        if ACount[i] > 0 and i != 0 and i != 1 and i != 2 and i != 4 and i != 7 and i != 8 and i != 9:
-            print(f"{i} {ACount[i]} {AOffet[i]} {ASize[i]} {AType[i]}")
-            
-
-    for i in range(vertex_count):
-        vert = {}
-        
-        for j in range(10):
-            offset = i * stride + AOffet[j]
-            if j == 0:  # Position
-                vert["positions"] = read_attribute(buffer, offset, AType[j], ACount[j])[:3]
-            elif j == 1:  # Tangent
-                pass
-            elif j == 2:  # Normal
-                vert["normals"] = read_attribute(buffer, offset, AType[j], ACount[j])[:3]
-            elif j == 4:  # UV0
-                uv_data = list(read_attribute(buffer, offset, AType[j], ACount[j])[:2])
-
-                # Effectuer l'opération 1.0 - sur la composante Y des coordonnées UV
-                uv_data[1] = 1.0 - uv_data[1]
-
-                vert["uv_data"] = tuple(uv_data)
-            elif j == 7:  # Bone Weight
-                vert["weights"] = read_attribute(buffer, offset, AType[j], ACount[j])
-            elif j == 8:  # Bone Index
-                vn = read_attribute(buffer, offset, AType[j], ACount[j])
-                if node_table and len(node_table) > 0 and len(node_table) != 1:
-                    vert["bone_indices"] = (node_table[int(vn[0])], node_table[int(vn[1])], node_table[int(vn[2])], node_table[int(vn[3])])
-            elif j == 9:  # Color
-                vert["color_data"] = read_attribute(buffer, offset, AType[j], ACount[j])[:4]
-
-        vertices.append(vert)
+        if attributes[i][0] > 0 and i not in XPVB_ATTRIBUTES and i != 1:
+            print(f"{i} {attributes[i][0]} {attributes[i][1]} {attributes[i][2]} {attributes[i][3]}")
+
+    # Every vertex read at once, missing bytes at the end read as 0
+    dtype = vertex_dtype(attributes, stride)
+    data = np.frombuffer(bytes(buffer[:vertex_count * stride]).ljust(vertex_count * stride, b'\x00'), dtype=dtype, count=vertex_count)
+
+    def column(name):
+        if name in dtype.names:
+            return np.ascontiguousarray(data[name])
+
+        # Attribute without data
+        return np.zeros((vertex_count, 4), dtype=np.float32)
+
+    uv_data = column("uv_data")[:, :2].copy()
+    uv_data[:, 1] = 1.0 - uv_data[:, 1]
+
+    vertices = {
+        "positions": column("positions")[:, :3],
+        "normals": column("normals")[:, :3],
+        "uv_data": uv_data,
+        "weights": column("weights"),
+        "color_data": column("color_data")[:, :4],
+    }
+
+    # Bone index -> bone crc32 for every vertex at once
+    if node_table and len(node_table) > 0 and len(node_table) != 1:
+        bone_indices = column("bone_indices")[:, :4].astype(np.int64)
+        vertices["bone_indices"] = np.asarray(node_table, dtype=np.uint32)[bone_indices]
 
     return vertices
 
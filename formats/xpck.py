@@ -3,6 +3,7 @@ import math
 import zlib
 import struct
 from ..compression import *
+from ..compression.planner import Planner
 
 def calculate_f1_f2(file_count):
     fc1 = file_count & 0xFF
@@ -82,7 +83,10 @@ def open_file(file_item):
 
     return files
 
-def pack(files, output_file):
+def pack(files, output_file, planner=None):
+    if planner is None:
+        planner = Planner()
+
     offset = 0
     name_offset = 0
     
@@ -100,7 +104,7 @@ def pack(files, output_file):
 
     # Encode les noms de fichier en UTF-8 et les compresse avec zlib
     name_table = b''.join([filename.encode("utf-8") + b'\x00' for filename in list(files.keys())])
-    compressed_name_table = lz10.compress(name_table)
+    compressed_name_table = planner.compress(name_table, "name_table")
     compressed_name_table = fill_to_multiple_of_16(compressed_name_table, 12 * len(file_names) + 20 + len(compressed_name_table))
 
     # Écrit l'entête du fichier XPCK
@@ -1,11 +1,10 @@
 import os
+import numpy as np
 
 import bpy
 from bpy_extras.io_utils import ExportHelper, ImportHelper
 from bpy.props import StringProperty, EnumProperty
 
-import bmesh
-
 from math import radians
 from mathutils import Matrix, Quaternion, Vector
 
@@ -20,90 +19,122 @@ def get_bone_names(armature):
     for bone in armature.pose.bones:
         yield(bone.name)
 
+def unique_rows(array):
+    # Distinct rows in order of first appearance and the index of each row among them
+    values, first, inverse = np.unique(array, axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    return values[order], rank[inverse.reshape(-1)]
+
+def get_loop_order(mesh_data):
+    # Loop indices polygon by polygon and the loop count of each polygon
+    polygon_count = len(mesh_data.polygons)
+    loop_starts = np.empty(polygon_count, dtype=np.int32)
+    loop_totals = np.empty(polygon_count, dtype=np.int32)
+    mesh_data.polygons.foreach_get("loop_start", loop_starts)
+    mesh_data.polygons.foreach_get("loop_total", loop_totals)
+
+    offsets = np.repeat(np.cumsum(loop_totals) - loop_totals, loop_totals)
+    loops = np.repeat(loop_starts, loop_totals) + np.arange(loop_totals.sum()) - offsets
+
+    return loops, loop_totals
+
+def get_used_vertices(mesh_data, loops):
+    # Vertex of each loop, and the vertices in order of first use by the loops
+    loop_vertices = np.empty(len(mesh_data.loops), dtype=np.int32)
+    mesh_data.loops.foreach_get("vertex_index", loop_vertices)
+    loop_vertices = loop_vertices[loops]
+
+    used_vertices, vertex_indices = unique_rows(loop_vertices.reshape(-1, 1))
+
+    return loop_vertices, used_vertices.reshape(-1), vertex_indices
+
+def split_faces(indices, loop_totals):
+    # Per loop indices to one list per polygon
+    indices = indices.tolist()
+    starts = (np.cumsum(loop_totals) - loop_totals).tolist()
+
+    return [indices[start:start + total] for start, total in zip(starts, loop_totals.tolist())]
+
 def get_weights(mesh, bone_names):
     bone_indices = {name: i for i, name in enumerate(bone_names)}
-    vertices_dict = {}  # Dictionnaire pour stocker les indices de boucle par vertex
+    
+    # Bone index of each vertex group
+    group_bones = [bone_indices.get(group.name) for group in mesh.vertex_groups]
 
-    for face in mesh.data.polygons:
-        for loop_index in face.loop_indices:
-            vertex_index = mesh.data.loops[loop_index].vertex_index
-            if vertex_index not in vertices_dict:
-                vertices_dict[vertex_index] = len(vertices_dict)
+    loops, loop_totals = get_loop_order(mesh.data)
+    used_vertices = get_used_vertices(mesh.data, loops)[1]
 
-    weights = {}  # Dictionnaire pour stocker les poids par vertex
-    for vertex_index, vertex_dict_index in vertices_dict.items():
-        vertex = mesh.data.vertices[vertex_index]
+    # Vertex groups aren't exposed as arrays, only the groups of the used vertices are read
+    vertices = mesh.data.vertices
+    weights = {}
+    for vertex_dict_index, vertex_index in enumerate(used_vertices.tolist()):
         weights[vertex_dict_index] = {}
-        for group in vertex.groups:
+        for group in vertices[vertex_index].groups:
             if group.weight != 0:
-                bone_name = mesh.vertex_groups[group.group].name
-                bone_index = bone_indices.get(bone_name)
+                bone_index = group_bones[group.group]
                 if bone_index is not None:
                     weights[vertex_dict_index][bone_index] = group.weight
 
     return weights
             
 def get_mesh_information(mesh):
-    vertices_dict = {}
-    uv_dict = {}
-    normal_dict = {}
-    color_dict = {}
-    face_indices = []
-
-    vertices_info = {}
-    uv_info = {}
-    normal_info = {}
-    color_info = {}
-    
-    obj_matrix = mesh.matrix_world
+    mesh_data = mesh.data
+
+    loops, loop_totals = get_loop_order(mesh_data)
+    loop_count = len(loops)
+    loop_vertices, used_vertices, vertex_indices = get_used_vertices(mesh_data, loops)
+
+    # Positions and normals of every vertex
+    positions = np.empty(len(mesh_data.vertices) * 3, dtype=np.float32)
+    normals = np.empty(len(mesh_data.vertices) * 3, dtype=np.float32)
+    mesh_data.vertices.foreach_get("co", positions)
+    mesh_data.vertices.foreach_get("normal", normals)
+    positions = positions.reshape(-1, 3)
+    normals = normals.reshape(-1, 3)
+
+    # Uvs of every loop
+    uvs = np.zeros((len(mesh_data.loops), 2), dtype=np.float32)
+    if mesh_data.uv_layers.active is not None:
+        mesh_data.uv_layers.active.data.foreach_get("uv", uvs.reshape(-1))
+    uv_values, uv_indices = unique_rows(uvs[loops])
+
+    normal_values, normal_indices = unique_rows(normals[loop_vertices])
+
+    if mesh_data.vertex_colors.active is not None:
+        colors = np.empty((len(mesh_data.loops), 4), dtype=np.float32)
+        mesh_data.vertex_colors.active.data.foreach_get("color", colors.reshape(-1))
+        color_values, color_indices = unique_rows(colors[loops])
+    else:
+        color_values = np.empty((0, 4), dtype=np.float32)
+        color_indices = np.empty(loop_count, dtype=np.int64)
+
+    vertices_info = dict(enumerate(map(tuple, positions[used_vertices].tolist())))
+    uv_info = dict(enumerate(map(tuple, uv_values.tolist())))
+    normal_info = dict(enumerate(map(tuple, normal_values.tolist())))
+    color_info = dict(enumerate(map(tuple, color_values.tolist())))
+
+    face_vertices = split_faces(vertex_indices, loop_totals)
+    face_uvs = split_faces(uv_indices, loop_totals)
+    face_normals = split_faces(normal_indices, loop_totals)
+    if color_info:
+        face_colors = split_faces(color_indices, loop_totals)
+    else:
+        face_colors = [[] for _ in face_vertices]
 
-    if mesh.data.vertex_colors.active is not None:
-        vertex_colors = mesh.data.vertex_colors.active.data
-
-    for face in mesh.data.polygons:
-        face_index = {}
-        indices = []
-        vt_indices = []
-        vn_indices = []
-        color_indices = []
-
-        for loop_index in face.loop_indices:
-            vertex_index = mesh.data.loops[loop_index].vertex_index
-            
-            if vertex_index not in vertices_dict:
-                vertices_dict[vertex_index] = len(vertices_dict)
-                vertices_info[vertices_dict[vertex_index]] = mesh.data.vertices[vertex_index].co 
-
-            indices.append(vertices_dict[vertex_index])
-
-            uv = tuple(mesh.data.uv_layers.active.data[loop_index].uv)
-            if uv not in uv_dict:
-                uv_dict[uv] = len(uv_dict)
-                uv_info[uv_dict[uv]] = uv
-            vt_indices.append(uv_dict[uv])
-
-            normal = tuple(mesh.data.vertices[vertex_index].normal)
-            if normal not in normal_dict:
-                normal_dict[normal] = len(normal_dict)
-                normal_info[normal_dict[normal]] = normal
-            vn_indices.append(normal_dict[normal])
-
-            if mesh.data.vertex_colors.active is not None:
-                color = vertex_colors[loop_index].color
-                if color not in color_dict:
-                    color_dict[color] = len(color_dict)
-                    color_info[color_dict[color]] = color
-                color_indices.append(color_dict[color])
-
-        face_index["v"] = indices
-        face_index["vt"] = vt_indices
-        face_index["vn"] = vn_indices
-        face_index["vc"] = color_indices
-        face_indices.append(face_index)
+    face_indices = []
+    for indices, vt_indices, vn_indices, color_indices in zip(face_vertices, face_uvs, face_normals, face_colors):
+        face_indices.append({"v": indices, "vt": vt_indices, "vn": vn_indices, "vc": color_indices})
 
     return face_indices, vertices_info, uv_info, normal_info, color_info
 
-def make_mesh(model_data, armature=None, bones=None, lib=None):
+# Imported weights are rounded to 1 / WEIGHT_STEPS, so a bone needs at most
+# WEIGHT_STEPS calls to VertexGroup.add whatever the number of vertices
+WEIGHT_STEPS = 1000
+
+def make_mesh(model_data, armature=None, bones=None, lib=None, report=print):
     # Create a new mesh object
     mesh = bpy.data.meshes.new(name=model_data['name'])
     mesh_obj = bpy.data.objects.new(name=model_data['name'], object_data=mesh)
@@ -115,122 +146,89 @@ def make_mesh(model_data, armature=None, bones=None, lib=None):
     bpy.context.view_layer.objects.active = mesh_obj
     mesh_obj.select_set(True)
 
-    # Switch to edit mode
-    bpy.ops.object.mode_set(mode='EDIT')
-
-    # Initialize array to store vertex data
-    positions = []
-    normals = []
-    uv_data = []
-    weights = []
-    bone_indices = []
-    color_data = []
-
-    # Fill the array with data from model_data['vertices']
-    for vertex_data in model_data['vertices']:
-        if 'positions' in vertex_data:
-            positions.append(vertex_data['positions'])
-      
-        if 'normals' in vertex_data:
-            normals.append(vertex_data['normals'])
-            
-        if 'uv_data' in vertex_data:    
-            uv_data.append(vertex_data['uv_data'])
-            
-        if 'weights' in vertex_data:
-            weights.append(vertex_data['weights'])
-            
-        if 'bone_indices' in vertex_data:    
-            bone_indices.append(vertex_data['bone_indices'])
-            
-        if 'color_data' in vertex_data:
-            color_data.append(vertex_data['color_data'])        
-    
-    bm = bmesh.from_edit_mesh(mesh)
+    # Columns of model_data['vertices']
+    vertices_data = model_data['vertices']
+    positions = vertices_data['positions']
+    vertex_count = len(positions)
 
-    # Create vertices
-    vertices = [bm.verts.new(pos) for pos in positions]
-                        
-    # Update normals
-    bm.normal_update()            
-            
-    # Create uv layers
-    uv_layer = bm.loops.layers.uv.verify()
-    
-    vertex_group_mapping = {}
-                    
-    # Create colors layer
-    colors_layer = bm.loops.layers.color.new('Color')            
-
-    # Create faces using triangle indices
-    for face_indices in model_data['triangles']:
-        if isinstance(face_indices, int):
-            continue
-        else:
-            v1_idx, v2_idx, v3_idx = face_indices
-
-        v1 = vertices[v1_idx]
-        v2 = vertices[v2_idx]
-        v3 = vertices[v3_idx]
-
-        # Check if the face already exists
-        existing_face = None
-        for existing_face in bm.faces:
-            if (existing_face.verts[0] == v1 and
-                existing_face.verts[1] == v2 and
-                existing_face.verts[2] == v3):
-                break
-        else:
-            # Face doesn't exist, create a new one
-            face = bm.faces.new((v1, v2, v3))
-
-            # Assign normals to vertices
-            for i, vert in enumerate(face.verts):
-                vert.normal = normals[face_indices[i]]
-
-            # Assign UV coordinates to vertices
-            for i, loop in enumerate(face.loops):
-                loop[uv_layer].uv = uv_data[face_indices[i]]
-
-            # Assign colors to vertices
-            for i, loop in enumerate(face.loops):
-                loop[colors_layer] = color_data[face_indices[i]]
-
-            # Collect vertex and bone index mapping
-            for i, vert in enumerate(face.verts):
-                index = face_indices[i]
-                vert_weights = weights[face_indices[i]]
-
-                for j, weight in enumerate(vert_weights):
-                    if face_indices[i] < len(bone_indices):
-                        bone_crc32 = bone_indices[face_indices[i]][j]
-
-                        if bone_crc32 in bones:
-                            bone_name = bones[bone_crc32]
-                            if index not in vertex_group_mapping:
-                                vertex_group_mapping[index] = []
-                            vertex_group_mapping[index].append((bone_name, weight))
-           
-    # Update the mesh
-    bmesh.update_edit_mesh(mesh)
-    
-    # Memory free
-    bm.free()
-    
-    # Switch back to object mode
-    bpy.ops.object.mode_set(mode='OBJECT')
+    triangles = np.array([face for face in model_data['triangles'] if not isinstance(face, int)], dtype=np.int64).reshape(-1, 3)
 
-    # Assign weights to vertex groups
-    for vert_index, group_data in vertex_group_mapping.items():
-        for bone_name, weight in group_data:
-            vertex_group = mesh_obj.vertex_groups.get(bone_name)
+    # Indices past the vertex buffer would make a corrupt mesh
+    in_range = np.all((triangles >= 0) & (triangles < vertex_count), axis=1)
+    if not in_range.all():
+        report(f"{model_data['name']}: {len(triangles) - in_range.sum()} faces dropped, their vertex indices are out of range")
+        triangles = triangles[in_range]
 
-            if not vertex_group:
-                vertex_group = mesh_obj.vertex_groups.new(name=bone_name)
+    # Blender can't hold faces with a repeated vertex or two faces with the same vertices
+    sorted_triangles = np.sort(triangles, axis=1)
+    valid = (sorted_triangles[:, 0] != sorted_triangles[:, 1]) & (sorted_triangles[:, 1] != sorted_triangles[:, 2])
+    triangles, sorted_triangles = triangles[valid], sorted_triangles[valid]
+    first_faces = np.unique(sorted_triangles, axis=0, return_index=True)[1]
+    triangles = triangles[np.sort(first_faces)]
 
-            # Assign weight to the vertex group
-            if weight > 0:
-                vertex_group.add([vert_index], weight, 'REPLACE')    
+    face_count = len(triangles)
+    loop_vertices = triangles.ravel()
+
+    # Create vertices, loops and faces at once
+    mesh.vertices.add(vertex_count)
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(positions, dtype=np.float32).ravel())
+
+    mesh.loops.add(face_count * 3)
+    mesh.loops.foreach_set("vertex_index", loop_vertices.astype(np.int32))
+
+    mesh.polygons.add(face_count)
+    mesh.polygons.foreach_set("loop_start", np.arange(0, face_count * 3, 3, dtype=np.int32))
+    if not mesh.polygons.bl_rna.properties["loop_total"].is_readonly:
+        mesh.polygons.foreach_set("loop_total", np.full(face_count, 3, dtype=np.int32))
+    mesh.polygons.foreach_set("use_smooth", np.ones(face_count, dtype=bool))
+
+    mesh.update(calc_edges=True)
+
+    # Create uv layers, one uv per loop
+    uv_layer = mesh.uv_layers.new(name="UVMap")
+    uv_layer.data.foreach_set("uv", np.ascontiguousarray(vertices_data['uv_data'][loop_vertices], dtype=np.float32).ravel())
+
+    # Create colors layer
+    if hasattr(mesh, "vertex_colors"):
+        colors_layer = mesh.vertex_colors.new(name='Color')
+    else:
+        colors_layer = mesh.color_attributes.new('Color', 'BYTE_COLOR', 'CORNER')
+    colors_layer.data.foreach_set("color", np.ascontiguousarray(vertices_data['color_data'][loop_vertices], dtype=np.float32).ravel())
+
+    # Normals of the file as custom normals
+    if hasattr(mesh, "use_auto_smooth"):
+        mesh.use_auto_smooth = True
+    mesh.normals_split_custom_set_from_vertices(np.ascontiguousarray(vertices_data['normals'], dtype=np.float32))
+
+    # Assign weights to vertex groups, only for the vertices of a face
+    if bones and 'bone_indices' in vertices_data:
+        weights = vertices_data['weights']
+        bone_indices = vertices_data['bone_indices']
+
+        used = np.zeros(vertex_count, dtype=bool)
+        used[loop_vertices] = True
+
+        for j in range(min(weights.shape[1], bone_indices.shape[1])):
+            for bone_crc32 in np.unique(bone_indices[used, j]):
+                bone_name = bones.get(int(bone_crc32))
+                if bone_name is None:
+                    continue
+
+                vertex_group = mesh_obj.vertex_groups.get(bone_name)
+                if not vertex_group:
+                    vertex_group = mesh_obj.vertex_groups.new(name=bone_name)
+
+                selected = np.flatnonzero(used & (bone_indices[:, j] == bone_crc32) & (weights[:, j] > 0))
+
+                # Weights rounded to WEIGHT_STEPS levels, one call per level for all its vertices
+                levels = np.rint(weights[selected, j] * WEIGHT_STEPS).astype(np.int32)
+                order = np.argsort(levels, kind='stable')
+                levels, selected = levels[order], selected[order]
+                starts = np.flatnonzero(np.diff(levels, prepend=-1))
+
+                for start, end in zip(starts, np.append(starts[1:], len(levels))):
+                    if levels[start] > 0:
+                        vertex_group.add(selected[start:end].tolist(), levels[start] / WEIGHT_STEPS, 'REPLACE')
 
     # Rotate the mesh 90 degrees around the X axis
     mesh_obj.rotation_euler = (radians(90), 0, 0)
@@ -272,7 +270,7 @@ def make_mesh(model_data, armature=None, bones=None, lib=None):
             
         mesh_obj.data.materials.append(mat)
   
-def fileio_write_xmpr(context, mesh_name, library_name, mode):
+def get_xmpr_arguments(context, mesh_name, library_name, mode):
     # Get Mesh
     mesh = bpy.data.objects[mesh_name]
     
@@ -285,9 +283,16 @@ def fileio_write_xmpr(context, mesh_name, library_name, mode):
             
     weights = dict(get_weights(mesh, bone_names))  
             
-    return xmpr.write(mesh.name_full, mesh.dimensions, indices, vertices, uvs, normals, colors, weights, bone_names, library_name, mode)
+    # Plain tuples, so the arguments can be sent to another process
+    vertices = {key: tuple(value) for key, value in vertices.items()}
+    colors = {key: tuple(value) for key, value in colors.items()}
+            
+    return (mesh.name_full, tuple(mesh.dimensions), indices, vertices, uvs, normals, colors, weights, bone_names, library_name, mode)
+
+def fileio_write_xmpr(context, mesh_name, library_name, mode, planner=None):
+    return xmpr.write(*get_xmpr_arguments(context, mesh_name, library_name, mode), planner)
 
-def fileio_open_xmpr(context, filepath):
+def fileio_open_xmpr(context, filepath, report=print):
     # Extract the file name without extension
     file_name = os.path.splitext(os.path.basename(filepath))[0]
 
@@ -296,7 +301,7 @@ def fileio_open_xmpr(context, filepath):
         mesh_data = xmpr.open(file.read())
 
         # Create the mesh using the model data
-        make_mesh(mesh_data)
+        make_mesh(mesh_data, report=report)
 
     return {'FINISHED'}
 
@@ -368,4 +373,4 @@ class ImportXMPR(bpy.types.Operator, ImportHelper):
     filter_glob: StringProperty(default="*.prm", options={'HIDDEN'})
     
     def execute(self, context):
-            return fileio_open_xmpr(context, self.filepath)            
\ No newline at end of file
+            return fileio_open_xmpr(context, self.filepath, report=lambda message: self.report({'WARNING'}, message))            
\ No newline at end of file
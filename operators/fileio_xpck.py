@@ -1,7 +1,9 @@
 import os
 import copy
+import uuid
 
 import bpy
+from bpy.app.handlers import persistent
 from bpy_extras.io_utils import ExportHelper, ImportHelper
 from bpy.props import StringProperty, EnumProperty, BoolProperty, CollectionProperty
 
@@ -10,7 +12,9 @@ import bmesh
 from math import radians
 from mathutils import Matrix, Quaternion, Vector
 
-from ..formats import xmpr, xpck, mbn, imgc, res, minf, xcsl, xcma, xcmt, cmn, txp
+from ..formats import xmpr, xpck, mbn, imgc, res, minf, xcsl, xcma, xcmt, cmn, txp, pool
+from ..compression.planner import Planner
+from ..compression.cache import CompressionCache, TextureCache
 from .fileio_xmpr import *
 from .fileio_xmtn import *
 from .fileio_xcma import *
@@ -82,7 +86,139 @@ def create_bone(armature, bone_name, parent_name, relative_location, relative_ro
     # Set object mode
     bpy.ops.object.mode_set(mode='OBJECT')
 
-def fileio_open_xpck(context, filepath, file_name = ""):
+# Texture file of the placeholder images and the import options to decode it with,
+# decoded by decode_pending_textures.
+# Keyed by a token stored in the image, the name can be taken by another image.
+pending_textures = {}
+
+PENDING_TEXTURE_PROPERTY = "level5_pending_texture"
+
+def add_pending_texture(image, texture_file, scale, workers, use_cache):
+    token = uuid.uuid4().hex
+    image[PENDING_TEXTURE_PROPERTY] = token
+    pending_textures[token] = (texture_file, scale, workers, use_cache)
+
+def pending_texture_images():
+    # Images that still wait for their texture by token
+    return {image[PENDING_TEXTURE_PROPERTY]: image for image in bpy.data.images if image.get(PENDING_TEXTURE_PROPERTY) in pending_textures}
+
+def prune_pending_textures():
+    # Drop the textures whose image is gone
+    images = pending_texture_images()
+    for token in list(pending_textures):
+        if token not in images:
+            del pending_textures[token]
+
+    return images
+
+@persistent
+def clear_pending_textures(dummy):
+    # The images belong to the file that was closed
+    pending_textures.clear()
+
+def fill_image(image, texture):
+    pixels, width, height, has_alpha = texture
+
+    if tuple(image.size) != (width, height):
+        image.scale(width, height)
+
+    image.pixels.foreach_set(pixels)
+    image.update()
+
+def make_image(texture_name, texture_file, scale=1):
+    # Empty image with the size of the texture at 1 / scale, filled by decode_textures
+    header = imgc.open_header(texture_file, scale)
+    if header is None:
+        return None
+
+    width, height, has_alpha = header
+
+    # Create a new image
+    image = bpy.data.images.new(texture_name, width=width, height=height, alpha=has_alpha)
+    if has_alpha == False:
+        image.alpha_mode = 'NONE'
+
+    return image
+
+def decode_textures(images, workers=0, cache=None, report=print):
+    """
+    Decode the texture files of `images`, a list of (image, texture_file, scale),
+    in worker processes and fill each image as soon as its pixels are back.
+    Textures found in `cache`, a TextureCache, aren't decoded at all.
+    Returns the number of images filled.
+    """
+    window_manager = bpy.context.window_manager
+    window_manager.progress_begin(0, len(images))
+
+    finished = 0
+    decoded = 0
+
+    def fill(image, texture):
+        nonlocal finished, decoded
+
+        if texture is not None:
+            fill_image(image, texture)
+            decoded += 1
+
+        finished += 1
+        window_manager.progress_update(finished)
+
+    try:
+        jobs = []
+        job_images = []
+        for image, texture_file, scale in images:
+            texture = imgc.open_cached(texture_file, cache, scale) if cache is not None else None
+
+            if texture is not None:
+                fill(image, texture)
+                continue
+
+            # Flat RGBA float32 pixels at the size of the texture, the image
+            # can have been resized since the import. The workers add them to the cache.
+            header = imgc.open_header(texture_file, scale)
+            if header is None:
+                fill(image, None)
+                continue
+
+            width, height, has_alpha = header
+            jobs.append((imgc.open, (texture_file, cache, scale), (width * height * 4,)))
+            job_images.append(image)
+
+        pool.run_shared_jobs(jobs, lambda index, texture: fill(job_images[index], texture), workers, report=report)
+    finally:
+        window_manager.progress_end()
+
+    return decoded
+
+def make_texture_cache(use_cache, report=print):
+    if not use_cache:
+        return None
+
+    try:
+        return TextureCache()
+    except OSError as e:
+        report(f"Texture cache unavailable ({e})")
+        return None
+
+def decode_pending_textures(report=print):
+    # Images by the workers and cache option of their import
+    groups = {}
+
+    # The image can have been removed since the import
+    for token, image in prune_pending_textures().items():
+        texture_file, scale, workers, use_cache = pending_textures[token]
+        groups.setdefault((workers, use_cache), []).append((image, texture_file, scale))
+        del image[PENDING_TEXTURE_PROPERTY]
+
+    pending_textures.clear()
+
+    decoded = 0
+    for (workers, use_cache), images in groups.items():
+        decoded += decode_textures(images, workers, make_texture_cache(use_cache, report), report)
+
+    return decoded
+
+def fileio_open_xpck(context, filepath, file_name = "", texture_mode = 'USED', workers = 0, use_cache = True, texture_scale = 1, report = print):
     scene = bpy.context.scene
     
     archive = xpck.open_file(filepath)
@@ -99,7 +235,7 @@ def fileio_open_xpck(context, filepath, file_name = ""):
         
     bones_data = []
     meshes_data = []
-    textures_data = []
+    texture_files = []
     camera_data = {}
     animations_data = []
     animations_split_data = []
@@ -107,7 +243,7 @@ def fileio_open_xpck(context, filepath, file_name = ""):
     for file_name in archive:
         if file_name.endswith('.xc'):
             try:
-                fileio_open_xpck(context, archive[file_name], file_name)
+                fileio_open_xpck(context, archive[file_name], file_name, texture_mode, workers, use_cache, texture_scale, report)
             except Exception as e:
                 pass
         elif file_name.endswith('.prm'):
@@ -115,7 +251,8 @@ def fileio_open_xpck(context, filepath, file_name = ""):
         elif file_name.endswith('.mbn'):
             bones_data.append(mbn.open(archive[file_name]))    
         elif file_name.endswith('.xi'):
-            textures_data.append(imgc.open(archive[file_name]))
+            # Only decoded once the textures to import are known
+            texture_files.append(archive[file_name])
         elif file_name.endswith('.cmr2'):
             hash_name, cam_values = xcma.open(archive[file_name])
             camera_data[hash_name] = cam_values
@@ -206,27 +343,38 @@ def fileio_open_xpck(context, filepath, file_name = ""):
         armature.rotation_euler = (radians(90), 0, 0)
 
     # Make libs
-    if len(textures_data) > 0 and res_data is not None:
+    if len(texture_files) > 0 and res_data is not None and texture_mode != 'SKIP':
         images = {}
-        res_textures_key = list(res_data[res.RESType.Texture])
-        
+        res_textures = res_data[res.RESType.Texture]
+
+        # The texture files are in the order of the textures in RES.bin
+        texture_files = dict(zip(res_textures, texture_files))
+
+        # Textures used by a material, the others are decoded on demand
+        used_textures = set()
+        if texture_mode == 'USED':
+            for material_value in res_data.get(res.RESType.MaterialData, {}).values():
+                used_textures.update(int(texture_crc32, 16) for texture_crc32 in material_value['textures'])
+
         # Make images
-        for i in range(len(textures_data)):
-            if textures_data[i] != None:
-                texture_data, width, height, has_alpha = textures_data[i]
-                texture_crc32 = res_textures_key[i]
-                texture_name = res_data[res.RESType.Texture][texture_crc32]['name']
-
-                # Create a new image
-                bpy.ops.image.new(name=texture_name, width=width, height=height, alpha=has_alpha)
-                image = bpy.data.images[texture_name]
-                if has_alpha == False:
-                    image.alpha_mode = 'NONE'
-
-                # Assign pixel data to the image
-                image.pixels = texture_data
-            
-                images[texture_crc32] = image
+        prune_pending_textures()
+        decode_images = []
+        for texture_crc32, texture_file in texture_files.items():
+            texture_name = res_textures[texture_crc32]['name']
+
+            image = make_image(texture_name, texture_file, texture_scale)
+            if image is None:
+                continue
+
+            images[texture_crc32] = image
+
+            if texture_mode == 'ALL' or texture_crc32 in used_textures:
+                decode_images.append((image, texture_file, texture_scale))
+            else:
+                add_pending_texture(image, texture_file, texture_scale, workers, use_cache)
+
+        # Every texture is decoded at once in worker processes
+        decode_textures(decode_images, workers, make_texture_cache(use_cache, report), report)
 
         # Make materials
         for material_crc32, material_value in res_data[res.RESType.MaterialData].items():
@@ -260,7 +408,7 @@ def fileio_open_xpck(context, filepath, file_name = ""):
                 bones = res_data[res.RESType.Bone]
                 
             # Create the mesh using the mesh data
-            make_mesh(mesh_data, armature=armature, bones=bones, lib=lib) 
+            make_mesh(mesh_data, armature=armature, bones=bones, lib=lib, report=report)
 
     # Check if there is an active object and if it's an armature
     if armature == None and len(animations_data) > 0:
@@ -340,14 +488,25 @@ def fileio_open_xpck(context, filepath, file_name = ""):
             
     return {'FINISHED'}
 
-def fileio_write_xpck(operator, context, filepath, template, mode, meshes = [], armature = None, textures = {}, animation = {}, split_animations = [], outline = [], cameras=[], properties=[], texprojs=[]):    
+def fileio_write_xpck(operator, context, filepath, template, mode, meshes = [], armature = None, textures = {}, animation = {}, split_animations = [], outline = [], cameras=[], properties=[], texprojs=[], compression_strategy="lz10", workers=0, use_cache=True, etc1_quality="medium"):    
+    cache = None
+    if use_cache:
+        try:
+            cache = CompressionCache()
+        except OSError as e:
+            operator.report({'WARNING'}, f"Compression cache unavailable ({e})")
+            
+    planner = Planner(compression_strategy, cache=cache)
+    
+    # Meshes and images are read from Blender here, then encoded and compressed by the pool
+    jobs = []
+    
     # Make meshes
-    xmprs = []
     atrs = []
     mtrs = []
     if meshes:
         for mesh in meshes:
-            xmprs.append(fileio_write_xmpr(context, mesh.name, mesh.library_name, template[0].modes[template[1]]))
+            jobs.append((xmpr.write, get_xmpr_arguments(context, mesh.name, mesh.library_name, template[0].modes[template[1]])))
             atrs.append(bytes.fromhex(template[0].atr))
             mtrs.append(bytes.fromhex(template[0].mtr))
 
@@ -358,7 +517,6 @@ def fileio_write_xpck(operator, context, filepath, template, mode, meshes = [],
             mbns.append(mbn.write(armature, bone))
             
     # Make images
-    imgcs = []
     if textures:
         linked_textures = []
         
@@ -368,11 +526,20 @@ def fileio_write_xpck(operator, context, filepath, template, mode, meshes = [],
         for texture in linked_textures:
             get_image_format = globals().get(texture.format)
             if get_image_format:
-                imgcs.append(imgc.write(bpy.data.images.get(texture.name), get_image_format()))
+                img = bpy.data.images.get(texture.name)
+                image_format = get_image_format()
+                if hasattr(image_format, "quality"):
+                    image_format.quality = etc1_quality
+                jobs.append((imgc.write_pixels, (img.name, imgc.get_pixels(img), img.size[0], img.size[1], image_format)))
             else:
                 operator.report({'ERROR'}, f"Class {texture.format} not found in img_format.")
                 return {'FINISHED'}
                 
+    # Results come back in the order of the jobs
+    results = pool.run_jobs(jobs, planner, workers, report=lambda message: operator.report({'WARNING'}, message))
+    xmprs = results[:len(atrs)]
+    imgcs = results[len(atrs):]
+                
     # Make animations
     mtns = []
     minfs = []
@@ -507,13 +674,17 @@ def fileio_write_xpck(operator, context, filepath, template, mode, meshes = [],
 
     if mode != "CAMERA":
         items, string_table = res.make_library(meshes = meshes, armature = armature, textures = textures, animation = animation, split_animations = split_animations, outline_name = "", properties=properties, texprojs=texprojs)
-        files["RES.bin"] = res.write_res(bytes.fromhex("4348524330300000"), items, string_table)
+        files["RES.bin"] = res.write_res(bytes.fromhex("4348524330300000"), items, string_table, planner)
     else:
         if len(cameras_sorted) > 0:
             files["CMR.bin"] = xcmt.write(cameras_sorted)
     
     # Create xpck
-    xpck.pack(files, filepath)
+    xpck.pack(files, filepath, planner)
+    
+    # Compression report, the last line is the total
+    for line in planner.summary():
+        operator.report({'INFO'}, line)
     
     return {'FINISHED'}
 
@@ -574,11 +745,17 @@ class TexturePropertyGroup(bpy.types.PropertyGroup):
         items=[
             ('RGBA8', "RGBA8", "Make RGBA8 image"),
             ('RGBA4', "RGBA4", "Make RGBA4 image"),
+            ('RGBA5551', "RGBA5551", "Make RGBA5551 image"),
             ('RBGR888', "RBGR888", "Make RBGR888 image"),
             ('RGB565', "RGB565", "Make RGB565 image"),
-            #('L4', "L4", "Make L4 image"),
-            #('ETC1', "ETC1", "Make ETC1 image"),
-            #('ETC1A4', "ETC1A4", "Make ETC1A4 image"),
+            ('LA8', "LA8", "Make LA8 image"),
+            ('LA4', "LA4", "Make LA4 image"),
+            ('L8', "L8", "Make L8 image"),
+            ('L4', "L4", "Make L4 image"),
+            ('A8', "A8", "Make A8 image"),
+            ('A4', "A4", "Make A4 image"),
+            ('ETC1', "ETC1", "Make ETC1 image"),
+            ('ETC1A4', "ETC1A4", "Make ETC1A4 image"),
         ],
         default='RGBA8'
     )
@@ -640,6 +817,40 @@ class ExportXC(bpy.types.Operator, ExportHelper):
         default='ARMATURE'
     )  
 
+    compression_strategy: bpy.props.EnumProperty(
+        name="Compression",
+        items=[
+            ('lz10', "LZ10", "Compress everything with LZ10"),
+            ('fast', "Fast", "Use the cheapest method that compresses about as well as the best one"),
+            ('small', "Small", "Try the most promising methods and keep the smallest output"),
+        ],
+        default='lz10'
+    )
+
+    export_workers: bpy.props.IntProperty(
+        name="Workers",
+        default=0,
+        min=0,
+        max=64,
+        description="Processes that encode and compress meshes and textures, 0 uses every core but one, 1 exports in Blender only"
+    )
+
+    etc1_quality: bpy.props.EnumProperty(
+        name="ETC1 Quality",
+        items=[
+            ('fast', "Fast", "Encode ETC1 textures with the average colours of each block"),
+            ('medium', "Medium", "Try every block layout"),
+            ('exhaustive', "Exhaustive", "Also search the base colours, much slower"),
+        ],
+        default='medium'
+    )
+
+    use_compression_cache: bpy.props.BoolProperty(
+        name="Compression Cache",
+        default=True,
+        description="Reuse the compressed data of payloads that didn't change since a previous export"
+    )
+
     mesh_properties: bpy.props.CollectionProperty(type=MeshPropertyGroup)
     libs: bpy.props.CollectionProperty(type=LibPropertyGroup)
     camera_properties: bpy.props.CollectionProperty(type=CameraPropertyGroup)
@@ -929,11 +1140,17 @@ class ExportXC(bpy.types.Operator, ExportHelper):
                     row.prop(camera_prop, "checked", text=camera_prop.name)
                     row.prop(camera_prop, "animation_name", text="Name")
                     row.prop(camera_prop, "speed", text="Speed")
+                    
+            box.prop(self, "compression_strategy", text="Compression")
+            box.prop(self, "export_workers", text="Workers")
+            box.prop(self, "use_compression_cache", text="Compression Cache")
         elif self.export_tab_control == 'TEXTURE':
             if self.export_option == 'CAMERA' or self.export_option == 'ANIMATION':
                 texture_box = layout.box()
                 texture_box.label(text="Not available on camera mode")
             else:
+                layout.prop(self, "etc1_quality", text="ETC1 Quality")
+                
                 meshes_props =[]
                 lib_indexes = []
                 
@@ -1153,7 +1370,7 @@ class ExportXC(bpy.types.Operator, ExportHelper):
                 if archive_prop.checked:
                     properties.append([archive_prop.name, archive_prop.value])
 
-        return fileio_write_xpck(self, context, self.filepath, [get_template_by_name(self.template_name), self.template_mode_name], self.export_option,  armature=armature, meshes=meshes, textures=textures, animation=animation, split_animations=split_animations, outline=outline, cameras=cameras, properties=properties, texprojs=texprojs)
+        return fileio_write_xpck(self, context, self.filepath, [get_template_by_name(self.template_name), self.template_mode_name], self.export_option,  armature=armature, meshes=meshes, textures=textures, animation=animation, split_animations=split_animations, outline=outline, cameras=cameras, properties=properties, texprojs=texprojs, compression_strategy=self.compression_strategy, workers=self.export_workers, use_cache=self.use_compression_cache, etc1_quality=self.etc1_quality)
         
 class ImportXC(bpy.types.Operator, ImportHelper):
     bl_idname = "import.xc"
@@ -1165,5 +1382,51 @@ class ImportXC(bpy.types.Operator, ImportHelper):
         options={'HIDDEN'}
     )
     
+    texture_mode: EnumProperty(
+        name="Textures",
+        items=[
+            ('ALL', "Decode all", "Decode every texture of the archive"),
+            ('USED', "Decode used", "Decode the textures used by a material, the others are decoded with Decode Textures"),
+            ('LATER', "Decode later", "Make empty images, decoded with Decode Textures"),
+            ('SKIP', "Skip", "Don't import the textures"),
+        ],
+        default='USED'
+    )
+    
+    import_workers: bpy.props.IntProperty(
+        name="Workers",
+        default=0,
+        min=0,
+        max=64,
+        description="Processes that decode the textures, 0 uses every core but one, 1 imports in Blender only"
+    )
+    
+    use_texture_cache: BoolProperty(
+        name="Texture Cache",
+        default=True,
+        description="Keep the decoded textures on disk, importing the same textures again skips decoding them"
+    )
+    
+    texture_resolution: EnumProperty(
+        name="Resolution",
+        items=[
+            ('1', "Full", "Decode the textures at their full resolution"),
+            ('2', "Half", "Decode the textures at half resolution, each pixel is the average of 2x2 pixels"),
+            ('4', "Quarter", "Decode the textures at quarter resolution, ETC1 textures only read the base colours of their blocks"),
+        ],
+        default='1'
+    )
+    
+    def execute(self, context):
+            return fileio_open_xpck(context, self.filepath, texture_mode=self.texture_mode, workers=self.import_workers, use_cache=self.use_texture_cache, texture_scale=int(self.texture_resolution), report=lambda message: self.report({'WARNING'}, message))
+
+class DecodeXCTextures(bpy.types.Operator):
+    bl_idname = "import.xc_decode_textures"
+    bl_label = "Decode XPCK Textures"
+    bl_description = "Decode the textures imported as empty images"
+    bl_options = {'UNDO'}
+
     def execute(self, context):
-            return fileio_open_xpck(context, self.filepath)
\ No newline at end of file
+        decoded = decode_pending_textures(report=lambda message: self.report({'WARNING'}, message))
+        self.report({'INFO'}, f"{decoded} textures decoded")
+        return {'FINISHED'}
\ No newline at end of file
@@ -1,3 +1,5 @@
+import numpy as np
+
 from struct import *
 
 class Color:
@@ -10,17 +12,63 @@ class Color:
         if (len(color) == 4):
             self.a = color[3]
 
+# 8 bit value of each 5 bit value
+TABLE_5BIT = np.array([ 0x00,0x08,0x10,0x18,0x20,0x29,0x31,0x39,
+                        0x41,0x4A,0x52,0x5A,0x62,0x6A,0x73,0x7B,
+                        0x83,0x8B,0x94,0x9C,0xA4,0xAC,0xB4,0xBD,
+                        0xC5,0xCD,0xD5,0xDE,0xE6,0xEE,0xF6,0xFF ], dtype=np.uint8)
+
 def convert8to5(col):
-    table = [ 0x00,0x08,0x10,0x18,0x20,0x29,0x31,0x39,
-                    0x41,0x4A,0x52,0x5A,0x62,0x6A,0x73,0x7B,
-                    0x83,0x8B,0x94,0x9C,0xA4,0xAC,0xB4,0xBD,
-                    0xC5,0xCD,0xD5,0xDE,0xE6,0xEE,0xF6,0xFF ]
     i = 0
-    while col > table[i]:
+    while col > TABLE_5BIT[i]:
         i += 1
         
     return i
 
+def convert8to5_array(values):
+    # Same as convert8to5 on every value
+    return np.searchsorted(TABLE_5BIT, values, side='left')
+
+def luminance(r, g, b):
+    return (0x4CB2 * r + 0x9691 * g + 0x1D3E * b) >> 16
+
+def channels(pixels):
+    # R, G, B and A columns of an array of RGBA pixels
+    pixels = np.asarray(pixels, dtype=np.int32).reshape(-1, 4)
+    return pixels[:, 0], pixels[:, 1], pixels[:, 2], pixels[:, 3]
+
+def read_pixels(buf, count, size):
+    # The first `count` pixels of `size` bytes, one row of bytes per pixel
+    count = min(count, len(buf) // size)
+    return np.frombuffer(buf, dtype=np.uint8, count=count * size).reshape(count, size)
+
+def read_shorts(buf, count):
+    return read_pixels(buf, count, 2).view('<u2')[:, 0].astype(np.int32)
+
+def read_nibbles(buf, count):
+    # 4 bit pixels, the first pixel of each byte is in the low nibble
+    data = np.frombuffer(buf, dtype=np.uint8, count=min((count + 1) // 2, len(buf)))
+
+    nibbles = np.empty(len(data) * 2, dtype=np.uint8)
+    nibbles[0::2] = data & 0xF
+    nibbles[1::2] = data >> 4
+
+    return nibbles[:count]
+
+def write_nibbles(values):
+    values = np.asarray(values, dtype=np.uint8)
+    if len(values) % 2:
+        values = np.append(values, np.uint8(0))
+
+    return (values[0::2] | (values[1::2] << 4)).tobytes()
+
+def write_bytes(*columns):
+    # One byte per column and per pixel
+    return np.stack(columns, axis=1).astype(np.uint8).tobytes()
+
+def new_pixels(count):
+    return np.full((count, 4), 255, dtype=np.uint8)
+
 class RGB:
     def __init__(self, r, g, b):
         self.R = r
@@ -84,12 +132,18 @@ class RGB:
     def _error_rgb(r, g, b):
         return 2 * r * r + 4 * g * g + 3 * b * b  # human perception
     
+# Every format reads and writes single pixels with decode / encode and
+# whole buffers with decode_array(buf, count), which returns up to `count`
+# RGBA pixels as a (N, 4) uint8 array, and encode_array(pixels), the
+# opposite. `bit_depth` is the number of bits per pixel in the image data.
+
 class RGBA4:
     name = "RGBA4"
     size = 2
     type = 1
     has_alpha = True
-    
+    bit_depth = 16
+
     def encode(self, color):
         r = color.r >> 4
         g = color.g >> 4
@@ -115,33 +169,57 @@ class RGBA4:
         b *= 16
         a *= 16
 
-        return Color([r, g, b, a])    
+        return Color([r, g, b, a])
+
+    def encode_array(self, pixels):
+        r, g, b, a = channels(pixels)
+        rgba4 = ((r >> 4) << 12) | ((g >> 4) << 8) | ((b >> 4) << 4) | (a >> 4)
+        return rgba4.astype('<u2').tobytes()
+
+    def decode_array(self, buf, count):
+        rgba4 = read_shorts(buf, count)
+
+        pixels = np.empty((len(rgba4), 4), dtype=np.uint8)
+        for i, shift in enumerate((12, 8, 4, 0)):
+            pixels[:, i] = ((rgba4 >> shift) & 0xF) * 16
+
+        return pixels
 
 class RGBA8:
     name = "RGBA8"
     size = 4
     type = 0
     has_alpha = True
-    
+    bit_depth = 32
+
     def encode(self, color):
         argb = (color.a << 24) | (color.r << 16) | (color.g << 8) | color.b
-        return bytes([(argb >> 24) & 0xFF, argb & 0xFF, (argb >> 8) & 0xFF, (argb >> 16) & 0xFF])       
-       
+        return bytes([(argb >> 24) & 0xFF, argb & 0xFF, (argb >> 8) & 0xFF, (argb >> 16) & 0xFF])
+
     def decode(self, data):
         if len(data) < 4:
             return Color([0, 0, 0, 0])
 
         argb = (data[0] << 24) | (data[3] << 16) | (data[2] << 8) | data[1]
-        return Color([(argb >> 16) & 0xFF, (argb >> 8) & 0xFF, argb & 0xFF, (argb >> 24) & 0xFF])      
+        return Color([(argb >> 16) & 0xFF, (argb >> 8) & 0xFF, argb & 0xFF, (argb >> 24) & 0xFF])
+
+    def encode_array(self, pixels):
+        r, g, b, a = channels(pixels)
+        return write_bytes(a, b, g, r)
+
+    def decode_array(self, buf, count):
+        # Stored as A, B, G, R
+        return read_pixels(buf, count, 4)[:, ::-1].copy()
 
 class RBGR888:
     name = "RBGR888"
     size = 3
     type = 3
     has_alpha = False
+    bit_depth = 24
 
     def encode(self, color):
-        return bytes([(color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF])
+        return bytes([color.b, color.g, color.r])
 
     def decode(self, data):
         if len(data) < 3:
@@ -150,47 +228,121 @@ class RBGR888:
         rgb = (data[2] << 16) | (data[1] << 8) | data[0]
         return Color([(rgb >> 16) & 0xFF, (rgb >> 8) & 0xFF, rgb & 0xFF, 255])
 
+    def encode_array(self, pixels):
+        r, g, b, a = channels(pixels)
+        return write_bytes(b, g, r)
+
+    def decode_array(self, buf, count):
+        data = read_pixels(buf, count, 3)
+
+        pixels = new_pixels(len(data))
+        pixels[:, :3] = data[:, ::-1]
+
+        return pixels
+
 class RGB8:
     name = "RGB8"
-    
+    size = 3
+    has_alpha = False
+    bit_depth = 24
+
     def encode(self, color):
-        return bytes([((color) & 0xFF), ((color >> 8) & 0xFF), ((color >> 16) & 0xFF)])
+        return bytes([color.b, color.g, color.r])
+
+    def decode(self, data):
+        return Color([data[2], data[1], data[0], 255])
+
+    def encode_array(self, pixels):
+        r, g, b, a = channels(pixels)
+        return write_bytes(b, g, r)
+
+    def decode_array(self, buf, count):
+        data = read_pixels(buf, count, 3)
+
+        pixels = new_pixels(len(data))
+        pixels[:, :3] = data[:, ::-1]
+
+        return pixels
 
 class RGBA4444:
     name = "RGBA4444"
+    size = 2
+    type = 1
     has_alpha = True
-    
+    bit_depth = 16
+
     def encode(self, color):
-        val = (((color >> 24) & 0xFF) / 0x11)
-        val += ((((color) & 0xFF) / 0x11) << 4)
-        val += ((((color >> 8) & 0xFF) / 0x11) << 8)
-        val += ((((color >> 16) & 0xFF) / 0x11) << 12)
-        return bytes([(val & 0xFF), (byte)(val >> 8)])
+        val = color.a // 0x11
+        val += (color.b // 0x11) << 4
+        val += (color.g // 0x11) << 8
+        val += (color.r // 0x11) << 12
+        return pack('<H', val)
+
+    def decode(self, data):
+        val = unpack('<H', data)[0]
+        return Color([(val >> 12) * 0x11, ((val >> 8) & 0xF) * 0x11, ((val >> 4) & 0xF) * 0x11, (val & 0xF) * 0x11])
+
+    def encode_array(self, pixels):
+        r, g, b, a = channels(pixels)
+        val = (a // 0x11) | ((b // 0x11) << 4) | ((g // 0x11) << 8) | ((r // 0x11) << 12)
+        return val.astype('<u2').tobytes()
+
+    def decode_array(self, buf, count):
+        val = read_shorts(buf, count)
+
+        pixels = np.empty((len(val), 4), dtype=np.uint8)
+        for i, shift in enumerate((12, 8, 4, 0)):
+            pixels[:, i] = ((val >> shift) & 0xF) * 0x11
+
+        return pixels
 
 class RGBA5551:
     name = "RGBA5551"
-    
+    size = 2
+    type = 2
+    has_alpha = True
+    bit_depth = 16
+
     def encode(self, color):
-        val = (((c >> 24) & 0xFF) > 0x80 or 0)
-        val += convert8to5(((c >> 16) & 0xFF)) << 11
-        val += convert8to5(((c >> 8) & 0xFF)) << 6
-        val += convert8to5(((c) & 0xFF)) << 1
-        v = pack('H', val);è
-        return bytes([(val & 0xFF), (byte)(val >> 8)])
+        val = int(color.a > 0x80)
+        val += convert8to5(color.r) << 11
+        val += convert8to5(color.g) << 6
+        val += convert8to5(color.b) << 1
+        return pack('<H', val)
+
+    def decode(self, data):
+        val = unpack('<H', data)[0]
+        return Color([TABLE_5BIT[val >> 11], TABLE_5BIT[(val >> 6) & 0x1F], TABLE_5BIT[(val >> 1) & 0x1F], (val & 1) * 255])
+
+    def encode_array(self, pixels):
+        r, g, b, a = channels(pixels)
+        val = (a > 0x80) | (convert8to5_array(r) << 11) | (convert8to5_array(g) << 6) | (convert8to5_array(b) << 1)
+        return val.astype('<u2').tobytes()
+
+    def decode_array(self, buf, count):
+        val = read_shorts(buf, count)
+
+        pixels = np.empty((len(val), 4), dtype=np.uint8)
+        for i, shift in enumerate((11, 6, 1)):
+            pixels[:, i] = TABLE_5BIT[(val >> shift) & 0x1F]
+        pixels[:, 3] = (val & 1) * 255
+
+        return pixels
 
 class RGB565:
     name = "RGB565"
     size = 2
     type = 4
     has_alpha = False
-    
+    bit_depth = 16
+
     def encode(self, color):
         r = int(color.r >> 3)
         g = int(color.g >> 2)
         b = int(color.b >> 3)
         val = (r << 11) | (g << 5) | b
         return pack('H', val);
-        
+
     def decode(self, data):
         if not data:
             return Color((0, 0, 0, 255))
@@ -205,87 +357,276 @@ class RGB565:
         g = (g << 2) | (g >> 4)
         b = (b << 3) | (b >> 2)
 
-        return Color((r, g, b, 255))   
+        return Color((r, g, b, 255))
+
+    def encode_array(self, pixels):
+        r, g, b, a = channels(pixels)
+        val = ((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)
+        return val.astype('<u2').tobytes()
+
+    def decode_array(self, buf, count):
+        val = read_shorts(buf, count)
+        r = (val >> 11) & 0x1F
+        g = (val >> 5) & 0x3F
+        b = val & 0x1F
+
+        # Scale the values back to 8-bit range
+        pixels = new_pixels(len(val))
+        pixels[:, 0] = (r << 3) | (r >> 2)
+        pixels[:, 1] = (g << 2) | (g >> 4)
+        pixels[:, 2] = (b << 3) | (b >> 2)
+
+        return pixels
 
 class RBGR555:
-    name = "RGB565"
-    
+    name = "RBGR555"
+    size = 2
+    has_alpha = False
+    bit_depth = 16
+
     def encode(self, color):
         r = int(color.r / 8)
         g = int((color.g /8)) << 5
         b = int((color.b /8)) << 10
         return pack('H', r+g+b);
 
+    def decode(self, data):
+        val = unpack('<H', data)[0]
+        r, g, b = val & 0x1F, (val >> 5) & 0x1F, (val >> 10) & 0x1F
+        return Color([(r << 3) | (r >> 2), (g << 3) | (g >> 2), (b << 3) | (b >> 2), 255])
+
+    def encode_array(self, pixels):
+        r, g, b, a = channels(pixels)
+        val = (r >> 3) | ((g >> 3) << 5) | ((b >> 3) << 10)
+        return val.astype('<u2').tobytes()
+
+    def decode_array(self, buf, count):
+        val = read_shorts(buf, count)
+
+        pixels = new_pixels(len(val))
+        for i, shift in enumerate((0, 5, 10)):
+            value = (val >> shift) & 0x1F
+            pixels[:, i] = (value << 3) | (value >> 2)
+
+        return pixels
+
 class LA8:
     name = "LA8"
-    
+    size = 2
+    type = 11
+    has_alpha = True
+    bit_depth = 16
+
     def encode(self, color):
-        return bytes([(((0x4CB2 * (color & 0xFF) + 0x9691 * ((color >> 8) & 0xFF) + 0x1D3E * ((color >> 8) & 0xFF)) >> 16) & 0xFF)])
+        return bytes([color.a, luminance(color.r, color.g, color.b)])
+
+    def decode(self, data):
+        return Color([data[1], data[1], data[1], data[0]])
+
+    def encode_array(self, pixels):
+        r, g, b, a = channels(pixels)
+        return write_bytes(a, luminance(r, g, b))
+
+    def decode_array(self, buf, count):
+        data = read_pixels(buf, count, 2)
+
+        pixels = np.empty((len(data), 4), dtype=np.uint8)
+        pixels[:, :3] = data[:, 1:2]
+        pixels[:, 3] = data[:, 0]
+
+        return pixels
 
 class HILO8:
     name = "HILO8"
-    
+    size = 2
+    has_alpha = False
+    bit_depth = 16
+
     def encode(self, color):
-        bytes([((color) & 0xFF), (byte)((color >> 8) & 0xFF)])
+        return bytes([color.g, color.r])
+
+    def decode(self, data):
+        return Color([data[1], data[0], 0, 255])
+
+    def encode_array(self, pixels):
+        r, g, b, a = channels(pixels)
+        return write_bytes(g, r)
+
+    def decode_array(self, buf, count):
+        data = read_pixels(buf, count, 2)
+
+        pixels = new_pixels(len(data))
+        pixels[:, 0] = data[:, 1]
+        pixels[:, 1] = data[:, 0]
+        pixels[:, 2] = 0
+
+        return pixels
 
 class L8:
     name = "L8"
-    
+    size = 1
+    type = 13
+    has_alpha = False
+    bit_depth = 8
+
     def encode(self, color):
-        return bytes([(((0x4CB2 * (color & 0xFF) + 0x9691 * ((color >> 8) & 0xFF) + 0x1D3E * ((color >> 8) & 0xFF)) >> 16) & 0xFF)])
+        return bytes([luminance(color.r, color.g, color.b)])
+
+    def decode(self, data):
+        return Color([data[0], data[0], data[0], 255])
+
+    def encode_array(self, pixels):
+        r, g, b, a = channels(pixels)
+        return write_bytes(luminance(r, g, b))
+
+    def decode_array(self, buf, count):
+        data = read_pixels(buf, count, 1)
+
+        pixels = new_pixels(len(data))
+        pixels[:, :3] = data
+
+        return pixels
 
 class A8:
     name = "A8"
-    
+    size = 1
+    type = 15
+    has_alpha = True
+    bit_depth = 8
+
     def encode(self, color):
-        return bytes([((color >> 24) & 0xFF)])
+        return bytes([color.a])
+
+    def decode(self, data):
+        return Color([255, 255, 255, data[0]])
+
+    def encode_array(self, pixels):
+        r, g, b, a = channels(pixels)
+        return write_bytes(a)
+
+    def decode_array(self, buf, count):
+        data = read_pixels(buf, count, 1)
+
+        pixels = new_pixels(len(data))
+        pixels[:, 3] = data[:, 0]
+
+        return pixels
 
 class LA4:
     name = "LA4"
-    
+    size = 1
+    type = 12
+    has_alpha = True
+    bit_depth = 8
+
     def encode(self, color):
-        return bytes([((color >> 24) & 0xFF), ((color) & 0xFF), ((color >> 8) & 0xFF), ((color >> 16) & 0xFF)]);
+        return bytes([(luminance(color.r, color.g, color.b) // 0x11) << 4 | color.a // 0x11])
+
+    def decode(self, data):
+        return Color([(data[0] >> 4) * 0x11] * 3 + [(data[0] & 0xF) * 0x11])
+
+    def encode_array(self, pixels):
+        r, g, b, a = channels(pixels)
+        return write_bytes(((luminance(r, g, b) // 0x11) << 4) | (a // 0x11))
+
+    def decode_array(self, buf, count):
+        data = read_pixels(buf, count, 1)[:, 0]
+
+        pixels = np.empty((len(data), 4), dtype=np.uint8)
+        pixels[:, :3] = ((data >> 4) * 0x11)[:, None]
+        pixels[:, 3] = (data & 0xF) * 0x11
+
+        return pixels
 
 class L4:
     name = "L4"
     size = 1
     type = 14
-    has_alpha = True
-    
+    has_alpha = False
+    bit_depth = 4
+
+    # Two pixels per byte, color_a is in the low nibble
     def encode(self, color_a, color_b):
-        return bytes([(L8().encode(color_a)[0] / 0x11) & 0xF  | (L8().encode(color_b)[0] / 0x11) << 4])
-        
+        return bytes([(L8().encode(color_a)[0] // 0x11) & 0xF  | (L8().encode(color_b)[0] // 0x11) << 4])
+
     def decode(self, data):
         if len(data) < 1:
-            return Color(0, 0, 0, 0)
+            return Color([0, 0, 0, 0])
 
         color_a = (data[0] & 0xF) * 0x11
-        color_b = (data[0] >> 4) * 0x11
-        return Color([color_a, color_a, color_a, color_b])        
+        return Color([color_a, color_a, color_a, 255])
+
+    def encode_array(self, pixels):
+        r, g, b, a = channels(pixels)
+        return write_nibbles(luminance(r, g, b) // 0x11)
+
+    def decode_array(self, buf, count):
+        data = read_nibbles(buf, count)
+
+        pixels = new_pixels(len(data))
+        pixels[:, :3] = (data * 0x11)[:, None]
+
+        return pixels
 
 class A4:
     name = "A4"
-    
+    size = 1
+    type = 16
+    has_alpha = True
+    bit_depth = 4
+
+    # Two pixels per byte, color_a is in the low nibble
     def encode(self, color_a, color_b):
-        return bytes([(A8().encode(color_a)[0] / 0x11) & 0xF  | (A8().encode(color_b)[0] / 0x11) << 4])
+        return bytes([(A8().encode(color_a)[0] // 0x11) & 0xF  | (A8().encode(color_b)[0] // 0x11) << 4])
+
+    def decode(self, data):
+        return Color([255, 255, 255, (data[0] & 0xF) * 0x11])
 
+    def encode_array(self, pixels):
+        r, g, b, a = channels(pixels)
+        return write_nibbles(a // 0x11)
+
+    def decode_array(self, buf, count):
+        data = read_nibbles(buf, count)
+
+        pixels = new_pixels(len(data))
+        pixels[:, 3] = data * 0x11
+
+        return pixels
+
+# The ETC formats are encoded by img_tool with compression.etc1, decode_array
+# reads the RGB(A) bytes given by the ETC1 decoder
 class ETC1:
     name = "ETC1"
     size = 3
     type = 27
     has_alpha = False
+    bit_depth = 4
+    quality = "medium"
 
     def decode(self, data):
         r, g, b = data[0], data[1], data[2]
-        return Color([r, g, b, 255]) 
-        
+        return Color([r, g, b, 255])
+
+    def decode_array(self, buf, count):
+        data = read_pixels(buf, count, 3)
+
+        pixels = new_pixels(len(data))
+        pixels[:, :3] = data
+
+        return pixels
+
 class ETC1A4:
     name = "ETC1A4"
     size = 4
     type = 28
     has_alpha = True
+    bit_depth = 8
+    quality = "medium"
 
     def decode(self, data):
         r, g, b, a = data[0], data[1], data[2], data[3]
         return Color([r, g, b, a])
-        
\ No newline at end of file
+
+    def decode_array(self, buf, count):
+        return read_pixels(buf, count, 4).copy()
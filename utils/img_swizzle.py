@@ -1,5 +1,7 @@
+import numpy as np
+
 from collections import namedtuple
-from functools import reduce
+from functools import reduce, lru_cache
 from operator import xor
 
 # Define a named tuple for representing a 2D point
@@ -26,6 +28,41 @@ class MasterSwizzle:
                       [v for v, j in zip(self._init_point_transform_on_y, range(len(self._init_point_transform_on_y))) if (macroY >> j) % 2 == 1],
                       self._init)
 
+    def get_points(self, point_count):
+        # Get for every point at once, as x and y arrays
+        points = np.arange(point_count)
+        macro_tile_count = points // self.MacroTileWidth // self.MacroTileHeight
+        macroX, macroY = macro_tile_count % self._width_in_tiles, macro_tile_count // self._width_in_tiles
+
+        x = (macroX * self.MacroTileWidth) ^ self._init[0]
+        y = (macroY * self.MacroTileHeight) ^ self._init[1]
+
+        for j, v in enumerate(self._bit_field_coords):
+            bit = points >> j & 1
+            x ^= bit * v[0]
+            y ^= bit * v[1]
+
+        for j, v in enumerate(self._init_point_transform_on_y):
+            bit = macroY >> j & 1
+            x ^= bit * v[0]
+            y ^= bit * v[1]
+
+        return x, y
+
+@lru_cache(maxsize=16)
+def imgc_points(width, height):
+    """
+    Position of every pixel of the image data of a width x height IMGC texture.
+    Computed once per size, the arrays are read only.
+    """
+    swizzle = IMGCSwizzle(width, height)
+    x, y = swizzle._zorderTrans.get_points(swizzle.Width * swizzle.Height)
+
+    x.flags.writeable = False
+    y.flags.writeable = False
+
+    return x, y
+
 class IMGCSwizzle:
     def __init__(self, width, height):
         self.Width = (width + 0x7) & ~0x7
@@ -45,4 +82,7 @@ class IMGCSwizzle:
                 point_index = point.Y * self.Width + point.X
                 point = self._zorderTrans.Get(point_index)
 
-            yield point
\ No newline at end of file
+            yield point
+
+    def get_points(self):
+        return imgc_points(self.Width, self.Height)
\ No newline at end of file
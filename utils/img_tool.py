@@ -6,61 +6,77 @@ from ..compression import etc1
 from .img_format import *
 from .img_swizzle import *
 
-zorder = [  0, 2, 8, 10, 32, 34, 40, 42,
-            1, 3, 9, 11, 33, 35, 41, 43,
-            4, 6, 12, 14, 36, 38, 44, 46,
-            5, 7, 13, 15, 37, 39, 45, 47,
-            16, 18, 24, 26, 48, 50, 56, 58,
-            17, 19, 25, 27, 49, 51, 57, 59,
-            20, 22, 28, 30, 52, 54, 60, 62,
-            21, 23, 29, 31, 53, 55, 61, 63 ]   
+def swizzle_pixels(px, height, width):
+    # Gather the pixels in the order of the image data, 8x8 tile after 8x8 tile
+    x, y = IMGCSwizzle(width, height).get_points()
+    return np.asarray(px, dtype=np.int32).reshape(-1, 4)[y * width + x]
+
+def tile_image(px, height, width):
+    """
+    Split the image in 8x8 tiles in a single pass.
+    Returns the tile table, the index of each tile of the image as 2 bytes,
+    and the pixels of every distinct tile in the order of the image data.
+    """
+    tiles = swizzle_pixels(px, height, width).reshape(-1, 64, 4)
+
+    # Tile content -> index of the tile in the image data
+    indexes = {}
+    unique_tiles = []
+    table = np.empty(len(tiles), dtype='<u2')
+
+    for i, tile in enumerate(tiles):
+        key = tile.tobytes()
+        index = indexes.get(key)
+
+        if index is None:
+            index = len(unique_tiles)
+            if index > 0xFFFF:
+                # The table stores each index on 2 bytes
+                raise OverflowError(f"{index + 1} distinct tiles don't fit in the 16-bit tile table")
+            indexes[key] = index
+            unique_tiles.append(i)
+
+        table[i] = index
+
+    return table.tobytes(), tiles[unique_tiles]
+
+def encode_etc1(tiles, height, width, img_format):
+    # Blocks of 16 pixels in the order of the image data, with the quality figures of the encoder
+    encoder = etc1.ETC1(img_format.has_alpha, width, height)
+    out = encoder.compress(tiles, img_format.quality)
+
+    return out, {"quality": img_format.quality, "psnr": encoder.psnr, "encode_seconds": encoder.seconds}
+
+def encode_tiles(tiles, height, width, img_format):
+    if img_format.name in ("ETC1", "ETC1A4"):
+        return encode_etc1(tiles, height, width, img_format)
+
+    # Every pixel is encoded at once, losslessly
+    return img_format.encode_array(tiles.reshape(-1, 4)), {}
+
+def encode_texture(px, height, width, img_format):
+    """
+    Tile table and image data of an IMGC texture, and a dict with the
+    quality, PSNR and encode time of lossy formats (empty for the others).
+    """
+    table, tiles = tile_image(px, height, width)
+    return (table,) + encode_tiles(tiles, height, width, img_format)
 
 def encode_image(px, height, width, img_format):
-    out = bytes()
-    tiles = []
-    
-
-    for h in range(0, height, 8):
-        for w in range(0, width, 8):
-            tile = []
-
-            for bh in range(8):
-                for bw in range(8):
-                    tile.append(px[(w+bw) + (h+bh) * width])
-
-            if tile not in tiles:
-                tiles.append(tile)
-                
-                for bh in range(8):
-                    for bw in range(8):
-                        pos = bw + bh * 8
-                        for i in range(len(zorder)):
-                            if zorder[i] == pos:
-                                color = Color(tile[i])
-                                out += img_format.encode(color)
-                                break
-    return out
+    return encode_texture(px, height, width, img_format)[1]
 
 def image_to_tile(px, height, width):
-    out = bytes()
-    tiles = []
-    
-    for h in range(0, height, 8):
-        for w in range(0, width, 8):
-            tile = []
-
-            for bh in range(8):
-                for bw in range(8):
-                    tile.append(px[(w+bw) + (h+bh) * width])
-            
-            if tile not in tiles:
-                tiles.append(tile)
-                out += int(len(tiles)-1).to_bytes(2, 'little')
-            else:
-                out += int(tiles.index(tile)).to_bytes(2, 'little')          
-    return out
-
-def decode_image(tile, image_data, image_format, width, height, bit_depth):
+    return tile_image(px, height, width)[0]
+
+def preview_size(width, height, scale):
+    # Size of a texture decoded at 1 / scale of its resolution
+    return (width + scale - 1) // scale, (height + scale - 1) // scale
+
+def decode_image(tile, image_data, image_format, width, height, bit_depth, scale=1):
+    """
+    Pixels of an IMGC texture as flat float32 RGBA values from the bottom row.
+    `scale` 2 or 4 decodes it at a half or a quarter of its resolution.
+    """
     table_value = BytesIO(tile).getvalue()
     
     table_value_len = len(table_value)
@@ -84,31 +100,45 @@ def decode_image(tile, image_data, image_format, width, height, bit_depth):
 
     imgc_swizzle = IMGCSwizzle(width, height)
 
-    if image_format.name == "ETC1A4":
-        image_data_after_swizzle = bytearray(etc1.ETC1(True, width, height).decompress(ms))
-    elif image_format.name == "ETC1":
-        image_data_after_swizzle = bytearray(etc1.ETC1(False, width, height).decompress(ms))
+    # Pixels averaged together, in the order of the image data each group of
+    # scale * scale pixels is a square
+    group = scale * scale
+    has_alpha = image_format.name == "ETC1A4"
+
+    if image_format.name in ("ETC1", "ETC1A4") and scale == 4:
+        # A block is 4x4 pixels, its base colours are enough
+        block_count = ((width + 3) // 4) * ((height + 3) // 4)
+        colors = image_format.decode_array(etc1.block_colors(ms, width, height, has_alpha).tobytes(), block_count)
+        group = 1
     else:
-        image_data_after_swizzle = ms
-    
-    pixel_count = width * height
-    pixels = [[0.0, 0.0, 0.0, 0.0] for _ in range(width * height)]
+        if image_format.name in ("ETC1", "ETC1A4"):
+            image_data_after_swizzle = bytearray(etc1.ETC1(has_alpha, width, height).decompress(ms))
+        else:
+            image_data_after_swizzle = ms
+
+        colors = image_format.decode_array(image_data_after_swizzle, width * height)
+
+    if group > 1:
+        # Box filter, rounded to 8 bits like the full size pixels
+        colors = colors[:len(colors) // group * group].reshape(-1, group, 4)
+        colors = np.rint(colors.mean(axis=1)).astype(np.uint8)
 
-    for i, swizzled_point in zip(range(pixel_count), imgc_swizzle.get_point_sequence()):
-        dataIndex = i * image_format.size
-        group = image_data_after_swizzle[dataIndex:dataIndex + image_format.size]
-        color = image_format.decode(group)
+    pixel_count = len(colors)
+    scaled_width, scaled_height = preview_size(width, height, scale)
 
-        # Calculer les indices x, y pour accéder directement à la position dans le tableau pixels
-        x, y = swizzled_point.X, swizzled_point.Y
+    # Position of each pixel, the image is stored from the top row
+    x, y = imgc_swizzle.get_points()
+    x = x[:pixel_count * scale * scale:scale * scale] // scale
+    inverted_y = scaled_height - 1 - y[:pixel_count * scale * scale:scale * scale] // scale
 
-        # Inverser l'indice y
-        inverted_y = height - 1 - y
+    inside = (x < scaled_width) & (inverted_y >= 0)
 
-        if 0 <= x < width and 0 <= inverted_y < height:
-            pixels[(inverted_y * width) + x] = [color.r, color.g, color.b, color.a]
+    # Scatter every pixel to its place at once
+    pixels = np.zeros((scaled_width * scaled_height, 4), dtype=np.float32)
+    pixels[inverted_y[inside] * scaled_width + x[inside]] = colors[inside]
 
-    # Convertir les valeurs de pixels en float et les aplatir
-    pixels = [chan / 255.0 for px in pixels for chan in px]
+    # Flat float32 values, as Image.pixels.foreach_set takes them
+    pixels /= 255
+    pixels = pixels.ravel()
 
-    return pixels, width, height, image_format.has_alpha
\ No newline at end of file
+    return pixels, scaled_width, scaled_height, image_format.has_alpha
\ No newline at end of file